@@ -0,0 +1,235 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Streaming compression and decompression of COPY files, so that a
+compressed dump can be loaded or written without a plain-text copy of it
+ever touching the disk.
+"""
+
+import bz2
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+BLOCK_SIZE = 64 * 1024
+
+# add to zlib's wbits to read and write gzip headers instead of zlib ones
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+def gzip_compressor(level=6):
+    return zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+
+def gzip_decompressor():
+    return zlib.decompressobj(GZIP_WBITS)
+
+def xz_compressor():
+    return lzma.LZMACompressor()
+
+def xz_decompressor():
+    return lzma.LZMADecompressor()
+
+# name: (file extension, compressor factory, decompressor factory)
+compressions = {
+    'gzip': ('.gz', gzip_compressor, gzip_decompressor),
+    'bzip2': ('.bz2', bz2.BZ2Compressor, bz2.BZ2Decompressor),
+    'xz': ('.xz', xz_compressor, xz_decompressor),
+}
+
+def compression_for(fname, name=None):
+    """
+    Work out which compression to use for the named file: the given name
+    (one of the keys of compressions, or 'none'), or else whatever the
+    file's extension says. Returns None for plain files, and raises
+    ValueError for compressions we don't know or can't do here.
+    """
+    if name is None:
+        if fname is None:
+            return None
+        for name, (ext, _, _) in compressions.items():
+            if fname.lower().endswith(ext):
+                break
+        else:
+            return None
+    name = name.lower()
+    if name == 'none':
+        return None
+    if name not in compressions:
+        raise ValueError("COMPRESSION must be one of %s or 'none'."
+                         % ', '.join("'%s'" % n for n in sorted(compressions)))
+    if name == 'xz' and lzma is None:
+        raise ValueError('xz compression needs the lzma module '
+                         '(backports.lzma on Python 2).')
+    return name
+
+def split_extension(fname, compression):
+    """
+    Split fname into its base name and the extension for the given
+    compression, if it has one, so that something can be added in between.
+    """
+    if compression is not None:
+        ext = compressions[compression][0]
+        if fname.lower().endswith(ext):
+            return fname[:-len(ext)], fname[-len(ext):]
+    return fname, ''
+
+class DecompressingReader(object):
+    """
+    Read-only file-like wrapper that decompresses the file f as it is read.
+    Concatenated streams, as written by 'cat a.gz b.gz' or pbzip2, are read
+    one after the other. Supports enough of the file interface for csv
+    readers and OffsetLineSource: iteration, readline(), read() and a
+    forward-only seek(). tell() is the position in the decompressed data;
+    the underlying file is still available as .raw.
+    """
+
+    def __init__(self, f, compression):
+        self.raw = f
+        self.compression = compression
+        self.make_decompressor = compressions[compression][2]
+        self.decompressor = self.make_decompressor()
+        self.buf = ''
+        self.pos = 0
+        self.offset = 0
+
+    def fill(self):
+        data = self.raw.read(BLOCK_SIZE)
+        if not data:
+            return False
+        chunks = [self.buf[self.pos:]]
+        while data:
+            try:
+                chunks.append(self.decompressor.decompress(data))
+            except EOFError:
+                # bz2 and lzma complain about data past the end of a stream
+                # instead of leaving it in unused_data like zlib does
+                self.decompressor = self.make_decompressor()
+                continue
+            except Exception, e:
+                raise IOError("Can't decompress %r as %s: %s"
+                              % (getattr(self.raw, 'name', '?'), self.compression, e))
+            data = self.decompressor.unused_data
+            if data:
+                self.decompressor = self.make_decompressor()
+        self.buf = ''.join(chunks)
+        self.pos = 0
+        return True
+
+    def readline(self):
+        while True:
+            end = self.buf.find('\n', self.pos)
+            if end >= 0:
+                end += 1
+                break
+            if not self.fill():
+                end = len(self.buf)
+                break
+        line = self.buf[self.pos:end]
+        self.pos = end
+        self.offset += len(line)
+        return line
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buf) - self.pos < size:
+            if not self.fill():
+                break
+        end = len(self.buf) if size < 0 else min(len(self.buf), self.pos + size)
+        data = self.buf[self.pos:end]
+        self.pos = end
+        self.offset += len(data)
+        return data
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def seek(self, offset):
+        if offset < self.offset:
+            raise IOError("can't seek backwards in a compressed file")
+        while self.offset < offset:
+            if not self.read(min(offset - self.offset, BLOCK_SIZE)):
+                raise IOError('compressed file is shorter than offset %d' % offset)
+
+    def tell(self):
+        return self.offset
+
+    def fileno(self):
+        return self.raw.fileno()
+
+    def close(self):
+        self.raw.close()
+
+class CompressingWriter(object):
+    """
+    Write-only file-like wrapper that compresses everything written to it
+    on the way to the file f. The compressed stream is only complete once
+    close() has been called. tell() is the position in the compressed file.
+    """
+
+    def __init__(self, f, compression):
+        self.raw = f
+        self.compressor = compressions[compression][1]()
+
+    def write(self, data):
+        data = self.compressor.compress(data)
+        if data:
+            self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+    def tell(self):
+        return self.raw.tell()
+
+    def fileno(self):
+        return self.raw.fileno()
+
+    def close(self):
+        try:
+            self.raw.write(self.compressor.flush())
+        finally:
+            self.raw.close()
+
+def open_input(fname, compression):
+    """
+    Open fname for reading, decompressing it on the fly if compression
+    is not None.
+    """
+    f = open(fname, 'rb')
+    if compression is None:
+        return f
+    return DecompressingReader(f, compression)
+
+def open_output(fname, compression):
+    """
+    Open fname for writing, compressing it on the fly if compression
+    is not None.
+    """
+    f = open(fname, 'wb')
+    if compression is None:
+        return f
+    return CompressingWriter(f, compression)
@@ -0,0 +1,311 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Readers and writers for the COPY formats other than CSV: tab-separated
+values, and JSON lines with one object per row. The readers look like
+csv.reader objects, turning each record into a list of the same text
+COPY would read from a CSV file, and the writers like csv.writer ones.
+"""
+
+import binascii
+import re
+import time
+from decimal import Decimal
+
+from .copyutil import unreversed_type, convert_timestamp, make_row_formatter
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+COPY_FORMATS = ('csv', 'tsv', 'jsonl')
+
+class LineReader(object):
+    """
+    Base for readers of formats with one record per line. Subclasses
+    define parse_line(line), returning the row for a line or None to skip
+    it. Like a csv reader, line_num counts the lines read so far.
+    """
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.line_num = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while True:
+            line = self.lines.next()
+            self.line_num += 1
+            row = self.parse_line(line.rstrip('\r\n'))
+            if row is not None:
+                return row
+
+tsv_unescapes = {'t': '\t', 'n': '\n', 'r': '\r', '\\': '\\'}
+tsv_escape_re = re.compile(r'\\(.)')
+
+def tsv_unescape(val):
+    if '\\' not in val:
+        return val
+    return tsv_escape_re.sub(lambda m: tsv_unescapes.get(m.group(1), m.group(1)), val)
+
+def tsv_escape(val):
+    return val.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n') \
+              .replace('\r', '\\r')
+
+class TsvReader(LineReader):
+    """
+    Reads tab-separated values, with tabs, newlines, carriage returns and
+    backslashes in values escaped by a backslash, so that every line is
+    exactly one record.
+    """
+
+    def parse_line(self, line):
+        return map(tsv_unescape, line.split('\t'))
+
+class TsvWriter(object):
+    def __init__(self, f):
+        self.f = f
+
+    def writerow(self, row):
+        self.f.write('\t'.join(map(tsv_escape, row)) + '\n')
+
+class JsonLinesReader(LineReader):
+    """
+    Reads one JSON object per line, keyed by column name. Each value is
+    turned back into the text COPY FROM reads from CSV for a column of its
+    type; missing and null values become nullval. Blank lines are skipped.
+    """
+
+    def __init__(self, lines, columns, column_types, nullval):
+        LineReader.__init__(self, lines)
+        self.columns = columns
+        self.to_text = map(compile_json_text_converter, column_types)
+        self.nullval = nullval
+
+    def parse_line(self, line):
+        if not line.strip():
+            return None
+        try:
+            obj = json.loads(line, parse_float=Decimal)
+        except ValueError, e:
+            raise ValueError('line %d is not valid JSON: %s' % (self.line_num, e))
+        if not isinstance(obj, dict):
+            raise ValueError('line %d is not a JSON object' % (self.line_num,))
+        row = []
+        for name, to_text in zip(self.columns, self.to_text):
+            val = obj.get(name)
+            try:
+                row.append(self.nullval if val is None else to_text(val))
+            except ValueError, e:
+                raise ValueError('line %d, column %s: %s' % (self.line_num, name, e))
+        return row
+
+class JsonLinesWriter(object):
+    """
+    Writes one JSON object per line, keyed by column name, from rows of
+    values already serialized as JSON, as the functions from
+    compile_json_serializer() do.
+    """
+
+    def __init__(self, f, columns):
+        self.f = f
+        self.keys = [json.dumps(name) + ': ' for name in columns]
+
+    def writerow(self, row):
+        self.f.write('{' + ', '.join([k + v for (k, v) in zip(self.keys, row)]) + '}\n')
+
+# Mapping cql type base names to functions which serialize a value of that
+# type, as returned by the cql driver, to JSON text. Those for collection
+# types also get the serializers for their subtypes.
+_json_serializers = {}
+
+def compile_json_serializer(cqltype):
+    """
+    Look up the JSON serializer for a cql type, and for any of its
+    subtypes, just once, returning a function of a (non-null) value alone.
+    Types we don't know are serialized as blobs.
+    """
+    cqltype = unreversed_type(cqltype)
+    serializer = _json_serializers.get(cqltype.typename, serialize_blob)
+    if not cqltype.subtypes:
+        return serializer
+    subserializers = map(compile_json_serializer, cqltype.subtypes)
+    return lambda val: serializer(val, subserializers)
+
+def make_json_row_formatter():
+    """
+    Return a format_row(row, column_types) for COPY TO in JSON lines.
+    """
+    return make_row_formatter(compile_json_column_serializer)
+
+def compile_json_column_serializer(cqltype):
+    serialize = compile_json_serializer(cqltype)
+    return lambda val: 'null' if val is None else serialize(val)
+
+def json_serializer_for(typname):
+    def registrator(f):
+        _json_serializers[typname] = f
+        return f
+    return registrator
+
+@json_serializer_for('ascii')
+def serialize_string(val):
+    return json.dumps(val)
+
+json_serializer_for('text')(serialize_string)
+json_serializer_for('varchar')(serialize_string)
+json_serializer_for('inet')(serialize_string)
+
+@json_serializer_for('blob')
+def serialize_blob(val):
+    return '"0x%s"' % binascii.hexlify(val)
+
+@json_serializer_for('int')
+def serialize_number(val):
+    return str(val)
+
+json_serializer_for('bigint')(serialize_number)
+json_serializer_for('varint')(serialize_number)
+json_serializer_for('counter')(serialize_number)
+
+# what json.dumps gives for the floats JSON has no numbers for
+nonfinite_floats = ('NaN', 'Infinity', '-Infinity')
+
+@json_serializer_for('decimal')
+def serialize_decimal(val):
+    # as for floats, the values JSON has no numbers for are strings
+    if not val.is_finite():
+        return '"%s"' % (val,)
+    return str(val)
+
+@json_serializer_for('float')
+def serialize_float(val):
+    # json.dumps gives the shortest repr; NaN and Infinity aren't JSON,
+    # so they are written as strings, which COPY FROM reads back the same
+    text = json.dumps(val)
+    if text in nonfinite_floats:
+        return '"%s"' % (text,)
+    return text
+
+json_serializer_for('double')(serialize_float)
+
+@json_serializer_for('boolean')
+def serialize_boolean(val):
+    return 'true' if val else 'false'
+
+@json_serializer_for('uuid')
+def serialize_uuid(val):
+    return '"%s"' % (val,)
+
+json_serializer_for('timeuuid')(serialize_uuid)
+
+@json_serializer_for('timestamp')
+def serialize_timestamp(val):
+    """
+    ISO 8601, in UTC, to the millisecond, which is how precise timestamps
+    are. Python's own JSON module has no datetime type, so this is as
+    native as it gets.
+    """
+    millis = int(round(val * 1000))
+    seconds, millis = divmod(millis, 1000)
+    return '"%s.%03d+0000"' % (time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)),
+                               millis)
+
+@json_serializer_for('list')
+def serialize_list(val, subserializers):
+    serialize_item = subserializers[0]
+    return '[' + ', '.join([serialize_item(item) for item in val]) + ']'
+
+json_serializer_for('set')(serialize_list)
+
+@json_serializer_for('map')
+def serialize_map(val, subserializers):
+    serialize_key, serialize_val = subserializers
+    items = []
+    for k, v in val.iteritems():
+        k = serialize_key(k)
+        if not k.startswith('"'):
+            # JSON object keys can only be strings
+            k = '"%s"' % (k,)
+        items.append('%s: %s' % (k, serialize_val(v)))
+    return '{' + ', '.join(items) + '}'
+
+# types whose values are quoted inside a CQL collection literal
+quoted_item_types = ('ascii', 'text', 'varchar', 'inet')
+
+def compile_json_text_converter(cqltype):
+    """
+    Return a function turning a (non-null) JSON value for a column of the
+    given type into the text COPY FROM would read from a CSV file for it:
+    the value itself for simple types, and the CQL literal, like COPY TO
+    writes, for collections.
+    """
+    cqltype = unreversed_type(cqltype)
+    if cqltype.typename in ('list', 'set'):
+        to_item = compile_json_item_converter(cqltype.subtypes[0])
+        lbracket, rbracket = '[]' if cqltype.typename == 'list' else '{}'
+        return lambda val: lbracket + ', '.join(map(to_item, expect_type(val, list))) + rbracket
+    if cqltype.typename == 'map':
+        to_key, to_val = map(compile_json_item_converter, cqltype.subtypes)
+        return lambda val: '{' + ', '.join(['%s: %s' % (to_key(k), to_val(v))
+                                            for (k, v) in expect_type(val, dict).iteritems()]) + '}'
+    if cqltype.typename == 'timestamp':
+        return json_timestamp_text
+    return json_scalar_text
+
+def compile_json_item_converter(cqltype):
+    cqltype = unreversed_type(cqltype)
+    if cqltype.typename in quoted_item_types:
+        return lambda val: "'%s'" % json_scalar_text(val).replace("'", "''")
+    if cqltype.typename == 'timestamp':
+        return json_timestamp_text
+    return json_scalar_text
+
+def expect_type(val, jsontype):
+    if not isinstance(val, jsontype):
+        raise ValueError('expected a JSON %s, not %r'
+                         % ('array' if jsontype is list else 'object', val))
+    return val
+
+def json_scalar_text(val):
+    if isinstance(val, unicode):
+        return val.encode('utf8')
+    if isinstance(val, str):
+        return val
+    if isinstance(val, bool):
+        return 'true' if val else 'false'
+    if isinstance(val, (int, long, Decimal)):
+        return str(val)
+    if isinstance(val, float):
+        # other numbers are read as Decimal, so this is a bare NaN or
+        # Infinity. They aren't JSON, and COPY TO writes them as strings,
+        # but JavaScript and Python's json module write them like this
+        return json.dumps(val)
+    raise ValueError('unexpected JSON value %r' % (val,))
+
+def json_timestamp_text(val):
+    """
+    Timestamps are written as milliseconds since the epoch, which both
+    COPY FROM and Cassandra accept, whether the JSON has that or a date
+    string, since Cassandra doesn't take date strings with milliseconds.
+    """
+    if isinstance(val, unicode):
+        return str(int(round(convert_timestamp(val.encode('utf8')) * 1000)))
+    return json_scalar_text(val)
@@ -0,0 +1,1802 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import binascii
+import bisect
+import calendar
+import cStringIO
+import csv
+import errno
+import mmap
+import multiprocessing
+import os
+import random
+import re
+import signal
+import socket
+import stat
+import threading
+import time
+from decimal import Decimal
+from uuid import UUID
+from Queue import Empty, Full
+from StringIO import StringIO
+
+import cql
+from cql.cqltypes import ReversedType
+from . import ratelimit, tokenmap
+from .cql3handling import CqlRuleSet
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+def protect_name(name):
+    if isinstance(name, unicode):
+        name = name.encode('utf8')
+    return CqlRuleSet.maybe_escape_name(name)
+
+def unreversed_type(cqltype):
+    if issubclass(cqltype, ReversedType):
+        return cqltype.subtypes[0]
+    return cqltype
+
+def null_literal(layout, name, cqltype):
+    """
+    The CQL to use in place of a null value for the given column. Clustering
+    columns can't be null, so for those we use an empty value where the
+    type allows it.
+    """
+    if name in layout.clustering_key_columns and not cqltype.empty_binary_ok:
+        return 'blobAs%s(0x)' % cqltype.cql_parameterized_type().title()
+    return 'null'
+
+def literal_converter(cqltype):
+    """
+    Return a function turning the CSV text of a (non-null) value of the
+    given type into the CQL literal for it. Most are fine as they are.
+    """
+    if unreversed_type(cqltype).cql_parameterized_type() in ('ascii', 'text', 'timestamp', 'inet'):
+        return CqlRuleSet.escape_value
+    return None
+
+def insert_query_prefix(layout, columns):
+    """
+    Everything of an INSERT of the given columns up to the values, which
+    are to follow as a comma-separated list and a closing parenthesis.
+    """
+    return 'INSERT INTO %s.%s (%s) VALUES (' % (
+        protect_name(layout.keyspace_name),
+        protect_name(layout.columnfamily_name),
+        ', '.join(map(protect_name, columns))
+    )
+
+# Mapping cql type base names ("int", "map", etc) to functions which read
+# the CSV text of a value into the native value expected by the cql driver
+# for that type. Converters for collection types also get the converters
+# for their subtypes; compile_converter() puts these together.
+_converters = {}
+
+def compile_converter(cqltype):
+    """
+    Look up the converter for a cql type, and for any of its subtypes, just
+    once, returning a function of the CSV text of a value alone.
+    """
+    cqltype = unreversed_type(cqltype)
+    converter = _converters[cqltype.typename]
+    if not cqltype.subtypes:
+        return converter
+    subconverters = map(compile_converter, cqltype.subtypes)
+    return lambda val: converter(val, subconverters)
+
+def can_convert(cqltype):
+    cqltype = unreversed_type(cqltype)
+    return cqltype.typename in _converters \
+            and all(can_convert(t) for t in cqltype.subtypes)
+
+def converter_for(typname):
+    def registrator(f):
+        _converters[typname] = f
+        return f
+    return registrator
+
+@converter_for('ascii')
+def convert_ascii(val):
+    return val
+
+converter_for('inet')(convert_ascii)
+
+@converter_for('text')
+def convert_text(val):
+    return val.decode('utf8')
+
+converter_for('varchar')(convert_text)
+
+@converter_for('blob')
+def convert_blob(val):
+    if val[:2].lower() != '0x':
+        raise ValueError('blob values must start with 0x')
+    try:
+        return binascii.unhexlify(val[2:])
+    except TypeError, e:
+        raise ValueError(str(e))
+
+def convert_integer_type(val):
+    return int(val)
+
+converter_for('int')(convert_integer_type)
+converter_for('bigint')(convert_integer_type)
+converter_for('varint')(convert_integer_type)
+converter_for('counter')(convert_integer_type)
+
+def convert_floating_point_type(val):
+    return float(val)
+
+converter_for('float')(convert_floating_point_type)
+converter_for('double')(convert_floating_point_type)
+
+@converter_for('decimal')
+def convert_decimal(val):
+    try:
+        return Decimal(val)
+    except ArithmeticError:
+        raise ValueError('invalid decimal %r' % (val,))
+
+@converter_for('boolean')
+def convert_boolean(val):
+    lowered = val.lower()
+    if lowered == 'true':
+        return True
+    if lowered == 'false':
+        return False
+    raise ValueError('invalid boolean %r' % (val,))
+
+@converter_for('uuid')
+def convert_uuid(val):
+    return UUID(val)
+
+converter_for('timeuuid')(convert_uuid)
+
+timestamp_re = re.compile(r'''
+    ^ (\d{4}) - (\d{1,2}) - (\d{1,2})
+    (?: [T ] (\d{1,2}) : (\d{2}) (?: : (\d{2}) (?: \. (\d{1,3}) )? )? )?
+    \s* (Z | [+-] \d{2} :? \d{2})? $
+''', re.X)
+
+@converter_for('timestamp')
+def convert_timestamp(val):
+    """
+    Accepts the same forms Cassandra does: milliseconds since the epoch, or
+    yyyy-mm-dd[( |T)HH:MM[:SS[.fff]]][Z|(+|-)hhmm]. Times with no zone are
+    taken as local. Returns seconds since the epoch.
+    """
+    if val.lstrip('-').isdigit():
+        return int(val) / 1000.0
+    m = timestamp_re.match(val)
+    if m is None:
+        raise ValueError("can't interpret %r as a date" % (val,))
+    year, month, day, hour, minute, second, millis, zone = m.groups()
+    tval = tuple(int(n or 0) for n in (year, month, day, hour, minute, second))
+    if zone is None:
+        seconds = time.mktime(tval + (0, 0, -1))
+    else:
+        seconds = calendar.timegm(tval + (0, 0, 0))
+        if zone != 'Z':
+            zone = zone.replace(':', '')
+            offset = int(zone[1:3]) * 3600 + int(zone[3:5]) * 60
+            if zone[0] == '-':
+                offset = -offset
+            seconds -= offset
+    if millis is not None:
+        seconds += int(millis.ljust(3, '0')) / 1000.0
+    return seconds
+
+collection_token_re = re.compile(r"\s*('(?:[^']|'')*'|[][{}:,]|[^][{}:,'\s]+)\s*")
+
+def split_collection_literal(val, lbracket, rbracket, is_map=False):
+    """
+    Split a CQL list, set or map literal, as written by COPY TO, into the
+    CSV-style text of its items (or of its (key, value) pairs, for maps).
+    """
+    tokens = []
+    pos = 0
+    while pos < len(val):
+        m = collection_token_re.match(val, pos)
+        if m is None or m.end() == pos:
+            raise ValueError('invalid collection literal %r' % (val,))
+        tok = m.group(1)
+        if tok[0] == "'":
+            tok = ('item', tok[1:-1].replace("''", "'"))
+        elif tok not in '[]{}:,':
+            tok = ('item', tok)
+        tokens.append(tok)
+        pos = m.end()
+
+    def expect(expected):
+        if not tokens or tokens[0] != expected:
+            raise ValueError('invalid collection literal %r' % (val,))
+        tokens.pop(0)
+
+    def item():
+        if not tokens or not isinstance(tokens[0], tuple):
+            raise ValueError('invalid collection literal %r' % (val,))
+        return tokens.pop(0)[1]
+
+    expect(lbracket)
+    items = []
+    if tokens and tokens[0] == rbracket:
+        tokens.pop(0)
+    else:
+        while True:
+            if is_map:
+                key = item()
+                expect(':')
+                items.append((key, item()))
+            else:
+                items.append(item())
+            if tokens and tokens[0] == ',':
+                tokens.pop(0)
+                continue
+            expect(rbracket)
+            break
+    if tokens:
+        raise ValueError('invalid collection literal %r' % (val,))
+    return items
+
+@converter_for('list')
+def convert_list(val, subconverters):
+    convert_item = subconverters[0]
+    return [convert_item(item) for item in split_collection_literal(val, '[', ']')]
+
+@converter_for('set')
+def convert_set(val, subconverters):
+    convert_item = subconverters[0]
+    return set(convert_item(item) for item in split_collection_literal(val, '{', '}'))
+
+@converter_for('map')
+def convert_map(val, subconverters):
+    convert_key, convert_val = subconverters
+    return dict((convert_key(k), convert_val(v))
+                for (k, v) in split_collection_literal(val, '{', '}', is_map=True))
+
+# how many times to try a write the cluster was too busy for. with the
+# backoff between them, that's about a minute and a half of trying.
+MAX_OVERLOAD_TRIES = 10
+
+def execute_with_retries(throttle, numrows, executor, *args):
+    """
+    Call executor with the given arguments to write numrows rows, paced by
+    the given Throttle. Schema disagreement is retried a few times, like
+    Shell.perform_statement_untraced does, and timeouts or unavailable
+    errors rather more, with the throttle backing off each time. Returns
+    an error message, or None on success.
+    """
+    trynum = 1
+    while True:
+        throttle.wait(numrows)
+        try:
+            executor(*args)
+        except cql.IntegrityError, err:
+            trynum += 1
+            if trynum > 4:
+                return str(err)
+            time.sleep(ratelimit.backoff_delay(trynum))
+        except Exception, err:
+            if not ratelimit.is_overloaded(err):
+                return str(err)
+            trynum += 1
+            if trynum > MAX_OVERLOAD_TRIES:
+                return str(err)
+            throttle.overloaded(trynum)
+        else:
+            throttle.succeeded(numrows)
+            return None
+
+class Inserter(object):
+    """
+    Base class for the ways COPY FROM can write CSV records to a table.
+    Subclasses implement insert(row), returning an error message or None.
+    Up to maxerrors records can fail over the life of an inserter before
+    it gives up on the import. Writes are paced by throttle, if given.
+    """
+
+    def __init__(self, cursor, layout, columns, nullval, maxerrors=0, throttle=None):
+        if throttle is None:
+            throttle = ratelimit.Throttle()
+        self.throttle = throttle
+        self.cursor = cursor
+        self.layout = layout
+        self.columns = columns
+        self.nullval = nullval
+        self.maxerrors = maxerrors
+        self.numerrors = 0
+        # everything about the columns that doesn't change from row to row
+        self.column_types = tuple(unreversed_type(layout.get_column(name).cqltype)
+                                  for name in columns)
+        self.null_literals = tuple(null_literal(layout, name, cqltype) for (name, cqltype)
+                                   in zip(columns, self.column_types))
+
+    def import_records(self, records):
+        """
+        Insert a list of (record number, line number, row) tuples, skipping
+        the ones that fail until there have been too many. Returns a tuple of
+
+            (number of rows imported, rejects, error)
+
+        where rejects is a list of (record number, line number, row, error
+        message) tuples for the records that failed, and error is None, or
+        a (record number, line number, messages) tuple describing why the
+        import has to stop.
+        """
+        imported = 0
+        rejects = []
+        for rownum, line_num, row in records:
+            if len(row) != len(self.columns):
+                error = self.reject(rejects, rownum, line_num, row,
+                                    self.wrong_field_count_message(row),
+                                    self.wrong_field_count(rownum, line_num, row))
+            else:
+                err = self.insert(row)
+                if err is None:
+                    imported += 1
+                    continue
+                error = self.reject(rejects, rownum, line_num, row, err,
+                                    self.aborted(rownum, line_num, err))
+            if error is not None:
+                return imported, rejects, error
+        return imported, rejects, None
+
+    def reject(self, rejects, rownum, line_num, row, err, error):
+        """
+        Add a failed record to rejects. Returns None if the import can go
+        on, or else the error to stop it with: the given one if no errors
+        were allowed at all.
+        """
+        rejects.append((rownum, line_num, row, err))
+        self.numerrors += 1
+        if self.numerrors <= self.maxerrors:
+            return None
+        if self.maxerrors > 0:
+            return (rownum, line_num, [too_many_errors_message(self.maxerrors, rownum, line_num)])
+        return error
+
+    def wrong_field_count_message(self, row):
+        return 'Wrong number of fields (%d instead of %d)' % (len(row), len(self.columns))
+
+    def wrong_field_count(self, rownum, line_num, row):
+        return (rownum, line_num, ["Record #%d (line %d) has the wrong number of fields "
+                                   "(%d instead of %d)."
+                                   % (rownum, line_num, len(row), len(self.columns))])
+
+    def aborted(self, rownum, line_num, err):
+        return (rownum, line_num, [err, "Aborting import at record #%d (line %d). "
+                                        "Previously-inserted values still present."
+                                        % (rownum, line_num)])
+
+    def close(self):
+        pass
+
+class LiteralInserter(Inserter):
+    """
+    Inserts CSV records by submitting their values as intact CQL string
+    literals and letting Cassandra do its thing. Used when prepared
+    statements are not available, or when we don't know how to read some
+    column's values into native ones.
+    """
+
+    def __init__(self, cursor, layout, columns, nullval, maxerrors=0, throttle=None):
+        Inserter.__init__(self, cursor, layout, columns, nullval, maxerrors, throttle)
+        self.query_prefix = insert_query_prefix(layout, columns)
+        self.literal_converters = tuple(map(literal_converter, self.column_types))
+
+    def make_query(self, row):
+        nullval = self.nullval
+        values = []
+        for value, convert, null in zip(row, self.literal_converters, self.null_literals):
+            if value == nullval:
+                values.append(null)
+            elif convert is None:
+                values.append(value)
+            else:
+                values.append(convert(value))
+        return self.query_prefix + ', '.join(values) + ')'
+
+    def insert(self, row):
+        return execute_with_retries(self.throttle, 1, self.cursor.execute, self.make_query(row))
+
+class PreparedInserter(Inserter):
+    """
+    Inserts CSV records through prepared INSERT statements, binding the
+    native value of each field. Since null can't be bound over thrift, a
+    statement is prepared (once) for each distinct set of columns which
+    turn up null in a record, with those written as literals.
+    """
+
+    def __init__(self, cursor, layout, columns, nullval, maxerrors=0, throttle=None):
+        Inserter.__init__(self, cursor, layout, columns, nullval, maxerrors, throttle)
+        self.statements = {}
+        self.converters = tuple(map(compile_converter, self.column_types))
+        self.param_names = tuple('c%d' % n for n in range(len(columns)))
+
+    @staticmethod
+    def can_import(cursor, layout, columns):
+        return cursor.supports_prepared_queries \
+                and all(can_convert(layout.get_column(c).cqltype) for c in columns)
+
+    def get_statement(self, nullmarkers):
+        statement = self.statements.get(nullmarkers)
+        if statement is None:
+            values = [':' + param if marker is None else marker
+                      for (param, marker) in zip(self.param_names, nullmarkers)]
+            query = insert_query_prefix(self.layout, self.columns) + ', '.join(values) + ')'
+            statement = self.cursor.prepare_query(query)
+            self.statements[nullmarkers] = statement
+        return statement
+
+    def bind_row(self, row):
+        """
+        Returns the prepared statement to use for the given record, and the
+        parameters to execute it with.
+        """
+        nullval = self.nullval
+        params = {}
+        nullmarkers = []
+        for n, value in enumerate(row):
+            if value == nullval:
+                nullmarkers.append(self.null_literals[n])
+                continue
+            nullmarkers.append(None)
+            try:
+                params[self.param_names[n]] = self.converters[n](value)
+            except (ValueError, TypeError), e:
+                raise ValueError('Failed to import value %r (for column %r) as %s: %s'
+                                 % (value, self.columns[n],
+                                    self.column_types[n].cql_parameterized_type(), e))
+        return self.get_statement(tuple(nullmarkers)), params
+
+    def insert(self, row):
+        try:
+            statement, params = self.bind_row(row)
+        except Exception, e:
+            # bad values, or a failure to prepare the statement
+            return str(e)
+        return execute_with_retries(self.throttle, 1, self.cursor.execute_prepared,
+                                    statement, params)
+
+class BatchInserter(LiteralInserter):
+    """
+    Inserts CSV records in UNLOGGED batches of literal INSERT statements,
+    each batch holding up to batchsize bytes of CQL. If group_by_partition
+    is set, records are grouped so that each batch only covers a single
+    partition key, which lets the coordinator apply it as a single mutation.
+    """
+
+    def __init__(self, cursor, layout, columns, nullval, batchsize, group_by_partition,
+                 maxerrors=0, throttle=None):
+        LiteralInserter.__init__(self, cursor, layout, columns, nullval, maxerrors, throttle)
+        self.batchsize = batchsize
+        if group_by_partition:
+            self.key_indexes = [n for (n, name) in enumerate(columns)
+                                if name in layout.partition_key_columns]
+        else:
+            self.key_indexes = []
+
+    def import_records(self, records):
+        imported = 0
+        rejects = []
+        groups = {}
+        group_order = []
+        error = None
+        for rownum, line_num, row in records:
+            if len(row) != len(self.columns):
+                error = self.reject(rejects, rownum, line_num, row,
+                                    self.wrong_field_count_message(row),
+                                    self.wrong_field_count(rownum, line_num, row))
+                if error is not None:
+                    break
+                continue
+            key = tuple(row[n] for n in self.key_indexes)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [[], 0]
+                group_order.append(key)
+            query = self.make_query(row)
+            # send the group first if this query would take it over
+            # batchsize; a query bigger than that goes in a batch of its own
+            if group[0] and group[1] + len(query) > self.batchsize:
+                num, error = self.send_batch(group[0], rejects)
+                imported += num
+                if error is not None:
+                    return imported, rejects, error
+                group[:] = [[], 0]
+            group[0].append((rownum, line_num, row, query))
+            group[1] += len(query)
+        # send what's left, even when stopping at a bad record, so that all
+        # the records before it make it in
+        for key in group_order:
+            batch = groups[key][0]
+            if batch:
+                num, batch_error = self.send_batch(batch, rejects)
+                imported += num
+                if batch_error is not None:
+                    return imported, rejects, batch_error
+        return imported, rejects, error
+
+    def send_batch(self, batch, rejects):
+        if len(batch) > 1:
+            query = 'BEGIN UNLOGGED BATCH\n%s;\nAPPLY BATCH' \
+                    % ';\n'.join(q for (_, _, _, q) in batch)
+            if execute_with_retries(self.throttle, len(batch), self.cursor.execute, query) is None:
+                return len(batch), None
+            # find out which records were the trouble by sending them singly
+        imported = 0
+        for rownum, line_num, row, query in batch:
+            err = execute_with_retries(self.throttle, 1, self.cursor.execute, query)
+            if err is None:
+                imported += 1
+                continue
+            error = self.reject(rejects, rownum, line_num, row, err,
+                                self.aborted(rownum, line_num, err))
+            if error is not None:
+                return imported, error
+        return imported, None
+
+class RoutingInserter(Inserter):
+    """
+    Sends each CSV record straight to one of the replicas of its partition,
+    through an inserter from make_inserter(cursor, throttle) for each node,
+    all sharing one throttle. Connections to the nodes are opened with
+    connect(address) as they're first needed. Records whose partition key
+    can't be worked out, or whose replicas can't be reached, go through the
+    inserter for the default cursor instead.
+
+    Which replica gets a partition is picked at random for each token
+    range, so that different processes spread their writes across them.
+    """
+
+    def __init__(self, cursor, make_inserter, connect, token_map, serialize_key,
+                 maxerrors=0):
+        self.default = make_inserter(cursor)
+        self.throttle = self.default.throttle
+        self.make_inserter = make_inserter
+        self.connect = connect
+        self.consistency_level = cursor.consistency_level
+        self.token_map = token_map
+        self.serialize_key = serialize_key
+        self.maxerrors = maxerrors
+        self.numerrors = 0
+        self.choice = random.randrange(1024)
+        self.connections = []
+        # address: inserter for that node, or None if we couldn't connect
+        self.inserters = {}
+
+    def inserter_for(self, row):
+        try:
+            replicas = self.token_map.replicas_for_key(self.serialize_key(row))
+        except Exception:
+            # let the default inserter report whatever is wrong with the row
+            return self.default
+        address = replicas[self.choice % len(replicas)]
+        try:
+            inserter = self.inserters[address]
+        except KeyError:
+            inserter = self.inserters[address] = self.open_inserter(address)
+        if inserter is None:
+            return self.default
+        return inserter
+
+    def open_inserter(self, address):
+        try:
+            conn = self.connect(address)
+        except Exception:
+            return None
+        self.connections.append(conn)
+        cursor = conn.cursor()
+        cursor.consistency_level = self.consistency_level
+        return self.make_inserter(cursor, self.throttle)
+
+    def import_records(self, records):
+        """
+        Split the records up by the inserter they go to, keeping their
+        order otherwise, and import each lot in turn.
+        """
+        groups = {}
+        group_order = []
+        for record in records:
+            inserter = self.inserter_for(record[2])
+            group = groups.get(inserter)
+            if group is None:
+                group = groups[inserter] = []
+                group_order.append(inserter)
+            group.append(record)
+        imported = 0
+        rejects = []
+        for inserter in group_order:
+            num, group_rejects, error = inserter.import_records(groups[inserter])
+            imported += num
+            rejects.extend(group_rejects)
+            self.numerrors += len(group_rejects)
+            # each inserter keeps to the budget, but they share it too
+            if error is None and self.maxerrors > 0 and self.numerrors > self.maxerrors:
+                rownum, line_num = group_rejects[-1][:2]
+                error = (rownum, line_num,
+                         [too_many_errors_message(self.maxerrors, rownum, line_num)])
+            if error is not None:
+                return imported, rejects, error
+        return imported, rejects, None
+
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self.connections = []
+
+# seconds to wait for a connection to a replica, when checking which ones
+# can be reached
+REPLICA_CONNECT_TIMEOUT = 2
+
+def unreachable_addresses(addresses, port, timeout=REPLICA_CONNECT_TIMEOUT):
+    """
+    The set of the given addresses which can't be connected to on port
+    within timeout seconds, like the rpc_addresses of nodes behind NAT or
+    a tunnel, which only mean something on the nodes' own network. They're
+    all tried at once, so this takes timeout seconds at most.
+    """
+    unreachable = set()
+    def check(address):
+        try:
+            socket.create_connection((address, port), timeout).close()
+        except (socket.error, socket.timeout):
+            unreachable.add(address)
+    threads = [threading.Thread(target=check, args=(address,)) for address in set(addresses)]
+    for thread in threads:
+        thread.setDaemon(True)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return unreachable
+
+def compile_key_serializer(layout, columns):
+    """
+    Return a function giving the serialized partition key of a CSV record
+    of the given columns, as Cassandra hashes it, or None if the columns
+    don't cover the partition key or we can't read some key column's
+    values. The function raises an exception for records it can't make
+    the key of, like ones with a null or bad value in it.
+    """
+    serializers = []
+    for name in layout.partition_key_columns:
+        if name not in columns:
+            return None
+        cqltype = unreversed_type(layout.get_column(name).cqltype)
+        if not can_convert(cqltype):
+            return None
+        serializers.append((columns.index(name), compile_converter(cqltype), cqltype))
+
+    def serialize_part(row, serializer):
+        n, convert, cqltype = serializer
+        return cqltype.to_binary(cqltype.validate(convert(row[n])))
+
+    if len(serializers) == 1:
+        return lambda row: serialize_part(row, serializers[0])
+    return lambda row: tokenmap.composite_key([serialize_part(row, s) for s in serializers])
+
+def make_inserter(cursor, layout, columns, nullval, batchsize=None, group_by_partition=False,
+                  maxerrors=0, maxrate=None, throttle=None):
+    if throttle is None:
+        throttle = ratelimit.Throttle(maxrate)
+    if batchsize is not None:
+        return BatchInserter(cursor, layout, columns, nullval, batchsize, group_by_partition,
+                             maxerrors, throttle)
+    if PreparedInserter.can_import(cursor, layout, columns):
+        return PreparedInserter(cursor, layout, columns, nullval, maxerrors, throttle)
+    return LiteralInserter(cursor, layout, columns, nullval, maxerrors, throttle)
+
+def too_many_errors_message(maxerrors, rownum, line_num):
+    return ("Too many errors (more than MAXERRORS=%d). Aborting import at record #%d "
+            "(line %d). Previously-inserted values still present."
+            % (maxerrors, rownum, line_num))
+
+class RejectLog(object):
+    """
+    Keeps track of the records rejected by a COPY FROM, writing each out
+    to errfile, if given, as a CSV record of its line number, the error,
+    and then its fields. Otherwise the errors are reported through printerr,
+    unless that is None.
+    """
+
+    def __init__(self, errfile, dialect_options, printerr):
+        self.errfile = errfile
+        self.printerr = printerr
+        self.numrejected = 0
+        if errfile is not None:
+            self.writer = csv.writer(errfile, **dialect_options)
+
+    def add(self, rejects):
+        for rownum, line_num, row, err in rejects:
+            self.numrejected += 1
+            if self.errfile is not None:
+                self.writer.writerow([line_num, err] + row)
+            elif self.printerr is not None:
+                self.printerr('Rejected record #%d (line %d): %s' % (rownum, line_num, err))
+
+def read_chunks(reader, chunksize, first_rownum=0, first_line=0):
+    """
+    Group the records from a csv reader into lists of up to chunksize
+    (record number, line number, row) tuples. Record and line numbers start
+    after first_rownum and first_line, for input that doesn't start at the
+    beginning of its file.
+    """
+    records = []
+    rownum = first_rownum
+    for row in reader:
+        records.append((rownum, first_line + reader.line_num, row))
+        rownum += 1
+        if len(records) >= chunksize:
+            yield records
+            records = []
+    if records:
+        yield records
+
+class OffsetLineSource(object):
+    """
+    Iterates over the lines of a file, like the file itself would, but
+    keeps track of the byte offset just past the last line read. Iterating
+    over a file reads ahead, so its tell() won't do.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.offset = f.tell()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line
+
+    def tell(self):
+        return self.offset
+
+    def close(self):
+        self.f.close()
+
+class CsvChunk(object):
+    """
+    A byte range of a MappedCsvFile holding numrecords whole records, the
+    first of which is record number first_rownum, after line first_line.
+    Small enough to send to a worker process in place of the records.
+    """
+
+    __slots__ = ('start', 'end', 'first_rownum', 'first_line', 'numrecords', 'numlines')
+
+    def __init__(self, start, end, first_rownum, first_line, numrecords, numlines):
+        self.start = start
+        self.end = end
+        self.first_rownum = first_rownum
+        self.first_line = first_line
+        self.numrecords = numrecords
+        self.numlines = numlines
+
+    def __len__(self):
+        return self.numrecords
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+# a line with nothing but whitespace, as skipped by JsonLinesReader
+blank_line_re = re.compile(r'^[^\S\n]*\n', re.M)
+
+class MappedCsvFile(object):
+    """
+    A regular CSV file mapped into memory, so that it can be split into
+    chunks of whole records by byte offset, and the chunks parsed by
+    worker processes instead of all in the parent. Worker processes forked
+    after this is made share the mapping.
+
+    Chunks are parsed with the reader make_reader(lines) returns, which
+    should work like a csv reader. For CSV, dialect_options are needed to
+    find the record boundaries: splitting only looks at quote and escape
+    characters, so a boundary is never put inside a quoted field, and
+    costs next to nothing for the usual sort of file with few quoted
+    fields. Anything else is left to the csv module. Without
+    dialect_options, every line is taken to be a record, except blank
+    ones if skip_blank_lines is set, for readers which skip those.
+    """
+
+    def __init__(self, f, make_reader, dialect_options=None, skip_blank_lines=False):
+        self.f = f
+        self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.make_reader = make_reader
+        self.skip_blank_lines = skip_blank_lines
+        specials = ''
+        if dialect_options is not None:
+            self.quotechar = dialect_options.get('quotechar', '"')
+            self.escapechar = dialect_options.get('escapechar')
+            self.doublequote = dialect_options.get('doublequote', True)
+            # a quote only starts a quoted field at the beginning of the field
+            self.field_starts = (dialect_options.get('delimiter', ','), '\n', '\r')
+            specials = self.quotechar + (self.escapechar or '')
+        # where the next of each special character is, as far as we've looked
+        self.specials = dict.fromkeys(specials, -1)
+        self.searched = 0
+        self.offset = 0
+
+    @classmethod
+    def open(cls, f, make_reader, dialect_options=None, skip_blank_lines=False):
+        """
+        Map the open file f, or return None if it isn't a non-empty
+        regular file.
+        """
+        st = os.fstat(f.fileno())
+        if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+            return None
+        return cls(f, make_reader, dialect_options, skip_blank_lines)
+
+    def chunks(self, chunksize, start=0, first_rownum=0, first_line=0):
+        """
+        Yield CsvChunks of about chunksize records each, from offset start
+        to the end of the file. The size in bytes is estimated from the
+        length of the lines at the start.
+        """
+        sample = self.mm[start:start + 65536]
+        chunkbytes = max(1, len(sample) // max(1, sample.count('\n')) * chunksize)
+        while start < len(self.mm):
+            chunk = self.next_chunk(start, chunkbytes, first_rownum, first_line)
+            self.offset = chunk.end
+            yield chunk
+            start = chunk.end
+            first_rownum += chunk.numrecords
+            first_line += chunk.numlines
+
+    def next_chunk(self, start, size, first_rownum=0, first_line=0):
+        """
+        Find the chunk of whole records starting at offset start, which
+        must be at a record boundary, and ending at the first record
+        boundary at least size bytes on.
+        """
+        mm = self.mm
+        length = len(mm)
+        target = min(start + size, length)
+        pos = start
+        # newlines that don't end a record
+        inside = 0
+        # whether the last record runs into the end of the file without
+        # its quoted field ending, which still ends it for the csv module
+        unterminated = False
+        # just past the last escaped character, and the last quoted field
+        escaped_end = quoted_end = None
+        while True:
+            nl = mm.find('\n', max(pos, target - 1))
+            stop = length if nl < 0 else nl
+            s = self.find_special(pos)
+            if s >= stop:
+                end = length if nl < 0 else nl + 1
+                break
+            if mm[s] == self.escapechar:
+                # the csv module still ends a record at an escaped newline
+                # outside of quotes, but nothing else escaped is special,
+                # not even an escaped delimiter before a quote; right after
+                # a quoted field ended by a quote which could have been
+                # doubled, the escape character is just a character
+                if (s == quoted_end and self.doublequote) or mm[s + 1:s + 2] == '\n':
+                    pos = s + 1
+                else:
+                    pos = escaped_end = s + 2
+            elif s == start or (mm[s - 1] in self.field_starts and s != escaped_end):
+                pos = quoted_end = self.skip_quoted(s + 1)
+                if pos is None:
+                    pos = length
+                    unterminated = True
+                inside += mm[s:pos].count('\n')
+            else:
+                pos = s + 1
+            if pos >= length:
+                end = length
+                break
+        text = mm[start:end]
+        numlines = text.count('\n')
+        numrecords = numlines - inside
+        if self.skip_blank_lines:
+            numrecords -= len(blank_line_re.findall(text))
+        if end > start and text[-1] != '\n':
+            numlines += 1
+            if not (self.skip_blank_lines and text[text.rfind('\n') + 1:].isspace()):
+                numrecords += 1
+        elif unterminated:
+            numrecords += 1
+        return CsvChunk(start, end, first_rownum, first_line, numrecords, numlines)
+
+    def find_special(self, pos):
+        """
+        Return the offset of the first quote or escape character at or
+        after pos, or the length of the file if there isn't one. As long
+        as pos doesn't go backwards, each stretch of the file is only
+        searched once.
+        """
+        specials = self.specials
+        if pos < self.searched:
+            specials = self.specials = dict.fromkeys(specials, -1)
+        self.searched = pos
+        for char, found in specials.iteritems():
+            if found < pos:
+                found = self.mm.find(char, pos)
+                specials[char] = found if found >= 0 else len(self.mm)
+        return min(specials.itervalues()) if specials else len(self.mm)
+
+    def skip_quoted(self, pos):
+        """
+        Return the offset just past the quote ending the quoted field that
+        starts at pos, or None if it never ends.
+        """
+        mm = self.mm
+        while True:
+            s = self.find_special(pos)
+            if s == len(mm):
+                return None
+            if mm[s] == self.escapechar:
+                pos = s + 2
+            elif self.doublequote and mm[s + 1:s + 2] == self.quotechar:
+                pos = s + 2
+            else:
+                return s + 1
+
+    def parse(self, chunk):
+        """
+        Parse the records in a CsvChunk, returning a list of (record
+        number, line number, row) tuples like read_chunks() gives. The
+        records after the chunk are numbered going by how many it was
+        found to have, so if the reader makes out a different number,
+        csv.Error is raised rather than go on with the wrong numbers.
+        """
+        reader = self.make_reader(cStringIO.StringIO(self.mm[chunk.start:chunk.end]))
+        records = []
+        rownum = chunk.first_rownum
+        for row in reader:
+            records.append((rownum, chunk.first_line + reader.line_num, row))
+            rownum += 1
+        if len(records) != chunk.numrecords:
+            raise csv.Error('found %d records where %d were expected'
+                            % (len(records), chunk.numrecords))
+        return records
+
+    def tell(self):
+        return self.offset
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def close(self):
+        self.mm.close()
+
+class Checkpoint(object):
+    """
+    The progress of a COPY, saved as JSON to a file every so often, so that
+    a COPY which fails partway through can be run again with the same
+    CHECKPOINT option and pick up from where it got to. identity describes
+    the COPY; a checkpoint saved for a different one won't be loaded.
+    """
+
+    interval = 1.0
+
+    def __init__(self, fname, identity):
+        self.fname = fname
+        # normalize, so it compares equal to what json.load gives back
+        self.identity = json.loads(json.dumps(identity))
+        self.state = None
+        self.last_saved = 0
+        self.flush = None
+
+    def load(self):
+        """
+        Load the saved progress into self.state. Returns False if there is
+        none to resume from, and raises ValueError if the checkpoint file
+        can't be used.
+        """
+        try:
+            f = open(self.fname, 'rb')
+        except IOError, e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise ValueError("Can't read checkpoint file %r: %s" % (self.fname, e))
+        try:
+            try:
+                saved = json.load(f)
+            except ValueError:
+                raise ValueError('Checkpoint file %r is not valid.' % (self.fname,))
+        finally:
+            f.close()
+        if not isinstance(saved, dict) or saved.get('copy') != self.identity:
+            raise ValueError('Checkpoint file %r was saved for a different COPY.' % (self.fname,))
+        self.state = saved['state']
+        return True
+
+    def update(self, state, force=False):
+        """
+        Record the current progress, saving it if it hasn't been saved
+        in the last interval seconds (or at all, if force is set).
+        """
+        self.state = state
+        if force or time.time() - self.last_saved >= self.interval:
+            self.save()
+
+    def save(self):
+        if self.state is None:
+            return
+        if self.flush is not None:
+            # progress is only real once the output it covers is out
+            self.flush()
+        tmpname = self.fname + '.tmp'
+        f = open(tmpname, 'wb')
+        try:
+            json.dump({'copy': self.identity, 'state': self.state}, f)
+        finally:
+            f.close()
+        if os.name == 'nt' and os.path.exists(self.fname):
+            os.remove(self.fname)
+        os.rename(tmpname, self.fname)
+        self.last_saved = time.time()
+
+    def remove(self):
+        if os.path.exists(self.fname):
+            os.remove(self.fname)
+
+def parse_int_option(opts, name, default, minimum=1):
+    """
+    Pop the named integer option out of a COPY option dict, raising
+    ValueError with a user-presentable message if it isn't valid.
+    """
+    return parse_number_option(opts, name, default, minimum, int)
+
+def parse_float_option(opts, name, default, minimum=0):
+    return parse_number_option(opts, name, default, minimum, float)
+
+size_suffixes = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+def parse_size(val):
+    """
+    A number of bytes, optionally with a K, M, G or T suffix (and an
+    optional B after it) for that many binary kilobytes and so on.
+    """
+    val = val.strip().lower()
+    if val.endswith('b'):
+        val = val[:-1]
+    multiplier = 1
+    if val[-1:] in size_suffixes:
+        multiplier = size_suffixes[val[-1]]
+        val = val[:-1]
+    return int(float(val) * multiplier)
+
+def parse_size_option(opts, name, default, minimum=1):
+    return parse_number_option(opts, name, default, minimum, parse_size)
+
+def parse_number_option(opts, name, default, minimum, convert):
+    val = opts.pop(name, None)
+    if val is None:
+        return default
+    try:
+        val = convert(val)
+    except ValueError:
+        raise ValueError('Invalid value for %s: %r' % (name.upper(), val))
+    if minimum is not None and val < minimum:
+        raise ValueError('%s must be at least %s' % (name.upper(), minimum))
+    return val
+
+def format_bytes(num):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num < 1024:
+            break
+        num /= 1024.0
+    else:
+        unit = 'TB'
+    if unit == 'B':
+        return '%d B' % num
+    return '%.1f %s' % (num, unit)
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+class ProgressReporter(object):
+    """
+    Writes a line about how a COPY is getting along to stream (stderr)
+    every interval seconds: rows done, the rate since the last report and
+    overall, and, if bytes_done is given, the bytes read or written so far.
+    If total_bytes is known too, the line ends with an estimate of the time
+    left. On a terminal, each line overwrites the one before.
+    """
+
+    def __init__(self, stream, interval, verb, bytes_done=None, bytes_verb='read',
+                 total_bytes=None):
+        self.stream = stream
+        self.interval = interval
+        self.verb = verb
+        self.bytes_done = bytes_done
+        self.bytes_verb = bytes_verb
+        self.total_bytes = total_bytes
+        self.overwrite = hasattr(stream, 'isatty') and stream.isatty()
+        self.started = self.last_report = time.time()
+        self.last_rows = 0
+        self.last_width = 0
+
+    def update(self, rows):
+        now = time.time()
+        if now - self.last_report < self.interval:
+            return
+        current_rate = (rows - self.last_rows) / (now - self.last_report)
+        average_rate = rows / (now - self.started)
+        parts = ['%d rows %s' % (rows, self.verb),
+                 '%.0f rows/s (%.0f average)' % (current_rate, average_rate)]
+        if self.bytes_done is not None:
+            done = self.bytes_done()
+            parts.append('%s %s' % (format_bytes(done), self.bytes_verb))
+            if self.total_bytes and done > 0:
+                remaining = (self.total_bytes - done) * (now - self.started) / done
+                parts.append('ETA %s' % format_duration(max(0, remaining)))
+        self.write('; '.join(parts))
+        self.last_report = now
+        self.last_rows = rows
+
+    def write(self, line):
+        if self.overwrite:
+            self.stream.write('\r' + line.ljust(self.last_width))
+            self.last_width = len(line)
+        else:
+            self.stream.write(line + '\n')
+        self.stream.flush()
+
+    def finish(self):
+        if self.overwrite and self.last_width:
+            self.stream.write('\n')
+            self.stream.flush()
+
+# the lowest token of each partitioner whose ring we know how to walk, as a
+# CQL literal. no key ever has this token, so "token(k) > min" covers it all.
+partitioner_min_tokens = {
+    'org.apache.cassandra.dht.Murmur3Partitioner': str(-2 ** 63),
+    'org.apache.cassandra.dht.RandomPartitioner': '-1',
+    'org.apache.cassandra.dht.ByteOrderedPartitioner': '0x',
+    'org.apache.cassandra.dht.OrderPreservingPartitioner': "''",
+}
+
+# the partitioners whose tokens are integers, with their lowest and highest
+# possible token values
+numeric_token_bounds = {
+    'org.apache.cassandra.dht.Murmur3Partitioner': (-2 ** 63, 2 ** 63 - 1),
+    'org.apache.cassandra.dht.RandomPartitioner': (-1, 2 ** 127),
+}
+
+def ring_token_literal(partitioner, token):
+    """
+    Render a token string, as from describe_ring, as a CQL literal.
+    """
+    if partitioner in numeric_token_bounds:
+        return str(long(token))
+    if partitioner == 'org.apache.cassandra.dht.ByteOrderedPartitioner':
+        return '0x' + token
+    return CqlRuleSet.escape_value(token)
+
+def split_token_range(start, end, numsplits):
+    step, extra = divmod(end - start, numsplits)
+    bounds = [start]
+    for n in range(numsplits):
+        bounds.append(bounds[-1] + step + (n < extra))
+    return [(a, b) for (a, b) in zip(bounds, bounds[1:]) if a < b]
+
+def split_ring(partitioner, ring, numsplits):
+    """
+    Split the ring, as a list of TokenRanges from describe_ring, into
+    (start, end) pairs of CQL token literals for use with page_token_range().
+    The range wrapping around the end of the ring is cut in two at the
+    partitioner's minimum token. For partitioners with integer tokens, each
+    range is also split evenly so that there are at least numsplits ranges;
+    other rings can only be split at the node tokens.
+    """
+    mintoken = partitioner_min_tokens[partitioner]
+    bounds = numeric_token_bounds.get(partitioner)
+    if bounds is None:
+        ranges = []
+        for tr in ring:
+            start = ring_token_literal(partitioner, tr.start_token)
+            end = ring_token_literal(partitioner, tr.end_token)
+            if tr.start_token < tr.end_token:
+                ranges.append((start, end))
+            else:
+                ranges.append((start, None))
+                ranges.append((mintoken, end))
+        return ranges or [(mintoken, None)]
+    minval, maxval = bounds
+    pieces = []
+    for tr in ring:
+        start, end = long(tr.start_token), long(tr.end_token)
+        if start < end:
+            pieces.append((start, end))
+        else:
+            pieces.append((start, maxval))
+            pieces.append((minval, end))
+    if not pieces:
+        pieces = [(minval, maxval)]
+    per_piece = -(-numsplits // len(pieces))
+    ranges = []
+    for start, end in pieces:
+        ranges.extend((str(a), str(b)) for (a, b) in split_token_range(start, end, per_piece))
+    return ranges
+
+def token_literal(token):
+    """
+    Render a token, as decoded from a "SELECT token(...)" result, as a
+    CQL literal.
+    """
+    if isinstance(token, (int, long)):
+        return str(token)
+    if isinstance(token, unicode):
+        return CqlRuleSet.escape_value(token.encode('utf8'))
+    return '0x' + binascii.hexlify(token)
+
+def page_token_range(cursor, layout, columns, start, end, pagesize):
+    """
+    Fetch the given columns from all rows whose partition token is in the
+    range (start, end], where start and end are CQL token literals, and end
+    may be None for the end of the ring. Rows are fetched pagesize at a
+    time, in token order, and each page is yielded as a tuple of
+
+        (rows, column types, token literal for the last row in the page)
+
+    Pages always end on a partition boundary: when a page is cut off, the
+    last partition in it is fetched again separately, in full.
+    """
+    tokenexpr = 'token(%s)' % ', '.join(map(protect_name, layout.partition_key_columns))
+    select = 'SELECT %s, %s FROM %s.%s' % (', '.join(map(protect_name, columns)), tokenexpr,
+                                           protect_name(layout.keyspace_name),
+                                           protect_name(layout.columnfamily_name))
+    while True:
+        where = '%s > %s' % (tokenexpr, start)
+        if end is not None:
+            where += ' AND %s <= %s' % (tokenexpr, end)
+        cursor.execute('%s WHERE %s LIMIT %d' % (select, where, pagesize))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        column_types = cursor.column_types[:-1]
+        last_token = rows[-1][-1]
+        if len(rows) < pagesize:
+            yield [r[:-1] for r in rows], column_types, token_literal(last_token)
+            return
+        page = [r[:-1] for r in rows if r[-1] != last_token]
+        start = token_literal(last_token)
+        # a partition could outgrow any page size, so fetch the cut-off one
+        # on its own, with a limit as high as the one COPY TO always used.
+        cursor.execute('%s WHERE %s = %s LIMIT 99999999' % (select, tokenexpr, start))
+        page.extend(r[:-1] for r in cursor.fetchall())
+        yield page, column_types, start
+
+class ImportProcess(multiprocessing.Process):
+    """
+    A child process for a parallel COPY FROM. Each one opens its own
+    connection, then takes chunks of parsed CSV records off of inqueue
+    and hands them to the Inserter built by make_inserter(cursor),
+    reporting back on outqueue with a tuple of
+
+        (chunk id, number of rows imported, rejects, error)
+
+    as from Inserter.import_records(). If source is a MappedCsvFile, the
+    chunks can also be CsvChunks of it, which are parsed here. A chunk of
+    None tells the process to shut down.
+    """
+
+    def __init__(self, connect, make_inserter, consistency_level, inqueue, outqueue,
+                 source=None):
+        multiprocessing.Process.__init__(self)
+        self.daemon = True
+        self.connect = connect
+        self.make_inserter = make_inserter
+        self.consistency_level = consistency_level
+        self.source = source
+        self.inqueue = inqueue
+        self.outqueue = outqueue
+
+    def run(self):
+        # the parent cqlsh process deals with ^C, and tells us when to stop
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            conn = self.connect()
+        except Exception, e:
+            self.outqueue.put((None, 0, [], (None, None, ['Could not connect: %s' % (e,)])))
+            return
+        cursor = conn.cursor()
+        cursor.consistency_level = self.consistency_level
+        inserter = self.make_inserter(cursor)
+        try:
+            while True:
+                chunk = self.inqueue.get()
+                if chunk is None:
+                    break
+                chunkid, records = chunk
+                if isinstance(records, CsvChunk):
+                    try:
+                        records = self.source.parse(records)
+                    except (csv.Error, ValueError), e:
+                        self.outqueue.put((chunkid, 0, [], (records.first_rownum,
+                                                            records.first_line,
+                                                            ['Error parsing the records after '
+                                                             'line %d: %s'
+                                                             % (records.first_line, e)])))
+                        continue
+                imported, rejects, error = inserter.import_records(records)
+                self.outqueue.put((chunkid, imported, rejects, error))
+        finally:
+            inserter.close()
+            conn.close()
+
+class ImportPool(object):
+    """
+    Parent-side handle on a set of ImportProcess workers. Chunks of records
+    go in through feed(); results are collected as they become available,
+    and errors are reported through the printerr callable. Chunks can
+    finish in any order, so if on_commit is given, it is called with the
+    position fed along with a chunk once that chunk and all the ones before
+    it have been imported. Rejected records are passed to on_rejects, and
+    the import is stopped once there have been more than maxerrors of them.
+    If maxinflight is given, no more chunks are handed out while that many
+    rows are queued or being written. The running total of rows imported is
+    passed to progress.update(), if a progress reporter is given. With a
+    MappedCsvFile as source, CsvChunks of it can be fed in place of lists
+    of records, and are parsed by the workers.
+    """
+
+    def __init__(self, numworkers, connect, make_inserter, consistency_level, printerr,
+                 on_commit=None, on_rejects=None, maxerrors=0, maxinflight=None,
+                 progress=None, source=None):
+        self.printerr = printerr
+        self.progress = progress
+        self.maxinflight = maxinflight
+        self.inflight = 0
+        self.chunk_sizes = {}
+        self.on_commit = on_commit
+        self.on_rejects = on_rejects
+        self.maxerrors = maxerrors
+        self.numerrors = 0
+        self.positions = {}
+        self.finished = set()
+        self.next_commit = 0
+        self.inqueue = multiprocessing.Queue(maxsize=numworkers * 2)
+        self.outqueue = multiprocessing.Queue()
+        self.workers = [ImportProcess(connect, make_inserter, consistency_level,
+                                      self.inqueue, self.outqueue, source=source)
+                        for _ in range(numworkers)]
+        self.pending = 0
+        self.next_chunkid = 0
+        self.imported = 0
+        self.failed = False
+        for w in self.workers:
+            w.start()
+
+    def feed(self, records, position=None):
+        """
+        Hand a list of (record number, line number, row) tuples to the
+        workers. Returns False if the import has failed and no more input
+        should be fed.
+        """
+        self.collect_results()
+        if self.maxinflight is not None:
+            while self.inflight > 0 and self.inflight + len(records) > self.maxinflight \
+                    and not self.failed and self.check_alive():
+                self.collect_results(timeout=0.1)
+        if self.failed or not self.put((self.next_chunkid, records)):
+            return False
+        self.inflight += len(records)
+        self.chunk_sizes[self.next_chunkid] = len(records)
+        self.positions[self.next_chunkid] = position
+        self.next_chunkid += 1
+        self.pending += 1
+        return True
+
+    def put(self, item):
+        while True:
+            try:
+                self.inqueue.put(item, timeout=0.1)
+                return True
+            except Full:
+                self.collect_results()
+                if not self.check_alive():
+                    return False
+
+    def collect_results(self, timeout=None):
+        while True:
+            try:
+                if timeout is None:
+                    chunkid, imported, rejects, error = self.outqueue.get_nowait()
+                else:
+                    chunkid, imported, rejects, error = self.outqueue.get(timeout=timeout)
+            except Empty:
+                if self.progress is not None:
+                    self.progress.update(self.imported)
+                return
+            if chunkid is not None:
+                self.pending -= 1
+                self.inflight -= self.chunk_sizes.pop(chunkid)
+            self.imported += imported
+            if rejects:
+                self.numerrors += len(rejects)
+                if self.on_rejects is not None:
+                    self.on_rejects(rejects)
+                # each worker keeps to the budget, but they share it too
+                if error is None and self.numerrors > self.maxerrors and not self.failed:
+                    rownum, line_num = rejects[-1][:2]
+                    error = (rownum, line_num,
+                             [too_many_errors_message(self.maxerrors, rownum, line_num)])
+            if error is not None:
+                self.failed = True
+                for msg in error[2]:
+                    self.printerr(msg)
+            elif chunkid is not None:
+                self.finished.add(chunkid)
+                self.commit_finished()
+
+    def commit_finished(self):
+        committed = False
+        while self.next_commit in self.finished:
+            self.finished.remove(self.next_commit)
+            position = self.positions.pop(self.next_commit)
+            self.next_commit += 1
+            committed = True
+        if committed and self.on_commit is not None:
+            self.on_commit(position)
+
+    def check_alive(self):
+        if any(w.is_alive() for w in self.workers):
+            return True
+        self.failed = True
+        self.pending = 0
+        return False
+
+    def discard_queued(self):
+        while True:
+            try:
+                self.inqueue.get_nowait()
+            except Empty:
+                return
+            self.pending -= 1
+
+    def finish(self):
+        """
+        Wait for all outstanding chunks, shut down the workers, and return
+        the total number of rows imported.
+        """
+        if self.failed:
+            self.discard_queued()
+        for _ in self.workers:
+            if not self.put(None):
+                break
+        while self.pending > 0 and self.check_alive():
+            self.collect_results(timeout=0.1)
+        self.collect_results()
+        self.close()
+        return self.imported
+
+    def close(self):
+        for w in self.workers:
+            w.join(timeout=1)
+            if w.is_alive():
+                w.terminate()
+
+    def terminate(self):
+        for w in self.workers:
+            w.terminate()
+        for w in self.workers:
+            w.join()
+
+def make_row_formatter(compile_formatter):
+    """
+    Return a format_row(row, column_types) for COPY TO, formatting each
+    value with the function compile_formatter(cqltype) gives for its
+    column's type. Those are compiled just once for each set of column
+    types seen.
+    """
+    compiled = {}
+
+    def format_row(row, column_types):
+        key = tuple(column_types)
+        formatters = compiled.get(key)
+        if formatters is None:
+            formatters = compiled[key] = map(compile_formatter, column_types)
+        return [format_value(val) for (format_value, val) in zip(formatters, row)]
+    return format_row
+
+def export_token_range(cursor, layout, columns, start, end, pagesize, format_row,
+                       make_writer, track_rows=False):
+    """
+    Like page_token_range(), but yields each page as a tuple of
+
+        (csv text, row ends, number of rows, token literal for the last row)
+
+    with each row's values passed through format_row(row, column_types),
+    and written by the csv-writer-like object make_writer(file) returns.
+    If track_rows is set, row ends is a list of the offsets in the text
+    where each row ends; otherwise it's None.
+    """
+    for rows, column_types, last_token in page_token_range(cursor, layout, columns,
+                                                           start, end, pagesize):
+        buf = StringIO()
+        writer = make_writer(buf)
+        row_ends = None
+        if track_rows:
+            row_ends = []
+            for row in rows:
+                writer.writerow(format_row(row, column_types))
+                row_ends.append(buf.tell())
+        else:
+            for row in rows:
+                writer.writerow(format_row(row, column_types))
+        yield buf.getvalue(), row_ends, len(rows), last_token
+
+class ExportProcess(multiprocessing.Process):
+    """
+    A child process for a parallel COPY TO. Each one opens its own
+    connection, then takes (range id, start, end) token ranges off of
+    inqueue and exports them with export_token_range(), reporting back on
+    outqueue with tuples of
+
+        (range id, csv text, row ends, number of rows, last token, error)
+
+    The csv text is None for the last tuple sent for each range, which
+    carries the error message if exporting the range failed. If
+    open_shard(range id) is given, each range is written to the file it
+    opens instead, and the csv text sent back is always ''. A range of None
+    tells the process to shut down.
+    """
+
+    def __init__(self, connect, consistency_level, layout, columns, pagesize, format_row,
+                 make_writer, header, open_shard, track_rows, inqueue, outqueue):
+        multiprocessing.Process.__init__(self)
+        self.daemon = True
+        self.connect = connect
+        self.consistency_level = consistency_level
+        self.layout = layout
+        self.columns = columns
+        self.pagesize = pagesize
+        self.format_row = format_row
+        self.make_writer = make_writer
+        self.header = header
+        self.open_shard = open_shard
+        self.track_rows = track_rows
+        self.inqueue = inqueue
+        self.outqueue = outqueue
+
+    def run(self):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            conn = self.connect()
+        except Exception, e:
+            self.outqueue.put((None, None, None, 0, None, 'Could not connect: %s' % (e,)))
+            return
+        cursor = conn.cursor()
+        cursor.consistency_level = self.consistency_level
+        try:
+            while True:
+                tokenrange = self.inqueue.get()
+                if tokenrange is None:
+                    break
+                rangeid = tokenrange[0]
+                try:
+                    self.export_range(cursor, *tokenrange)
+                except Exception, e:
+                    self.outqueue.put((rangeid, None, None, 0, None, str(e)))
+                else:
+                    self.outqueue.put((rangeid, None, None, 0, None, None))
+        finally:
+            conn.close()
+
+    def export_range(self, cursor, rangeid, start, end):
+        pages = export_token_range(cursor, self.layout, self.columns, start, end,
+                                   self.pagesize, self.format_row, self.make_writer,
+                                   self.track_rows)
+        if self.open_shard is None:
+            for text, row_ends, numrows, last_token in pages:
+                self.outqueue.put((rangeid, text, row_ends, numrows, last_token, None))
+            return
+        shard = self.open_shard(rangeid)
+        try:
+            if self.header:
+                self.make_writer(shard).writerow(self.columns)
+            for text, row_ends, numrows, last_token in pages:
+                shard.write(text)
+                self.outqueue.put((rangeid, '', None, numrows, last_token, None))
+        finally:
+            shard.close()
+
+class ExportPool(object):
+    """
+    Parent-side handle on a set of ExportProcess workers. run() hands out
+    the token ranges and passes the csv text coming back to a write
+    callable, in whatever order the pages arrive. With track_rows set, the
+    offsets where each row in the text ends are passed to it too.
+    """
+
+    def __init__(self, numworkers, connect, consistency_level, layout, columns, pagesize,
+                 format_row, make_writer, printerr, header=False, open_shard=None,
+                 track_rows=False):
+        self.printerr = printerr
+        self.inqueue = multiprocessing.Queue()
+        # bounded, so workers can't get too far ahead of the writer
+        self.outqueue = multiprocessing.Queue(maxsize=numworkers * 4)
+        self.workers = [ExportProcess(connect, consistency_level, layout, columns, pagesize,
+                                      format_row, make_writer, header, open_shard,
+                                      track_rows, self.inqueue, self.outqueue)
+                        for _ in range(numworkers)]
+        self.exported = 0
+        for w in self.workers:
+            w.start()
+
+    def run(self, ranges, write, on_progress=None, progress=None):
+        """
+        Export the given (range id, start, end) token ranges, and return the
+        total number of rows exported. Stops at the first error. write may
+        be None when the workers are writing per-range files themselves.
+        If given, on_progress(range id, last token, finished) is called
+        after each page is written, and as each range finishes, and the
+        running total of rows is passed to progress.update().
+        """
+        for tokenrange in ranges:
+            self.inqueue.put(tokenrange)
+        for _ in self.workers:
+            self.inqueue.put(None)
+        remaining = len(ranges)
+        while remaining > 0:
+            try:
+                rangeid, text, row_ends, numrows, last_token, error = \
+                        self.outqueue.get(timeout=0.1)
+            except Empty:
+                if progress is not None:
+                    progress.update(self.exported)
+                if not any(w.is_alive() for w in self.workers):
+                    self.printerr('Export workers exited unexpectedly.')
+                    break
+                continue
+            if error is not None:
+                self.printerr(error)
+                break
+            if text is None:
+                remaining -= 1
+                if on_progress is not None:
+                    on_progress(rangeid, None, True)
+                continue
+            if write is None:
+                pass
+            elif row_ends is None:
+                write(text)
+            else:
+                write(text, row_ends)
+            self.exported += numrows
+            if on_progress is not None:
+                on_progress(rangeid, last_token, False)
+            if progress is not None:
+                progress.update(self.exported)
+        if remaining > 0:
+            self.terminate()
+        else:
+            self.close()
+        return self.exported
+
+    def close(self):
+        for w in self.workers:
+            w.join(timeout=1)
+            if w.is_alive():
+                w.terminate()
+
+    def terminate(self):
+        for w in self.workers:
+            w.terminate()
+        for w in self.workers:
+            w.join()
+
+class RollingOutput(object):
+    """
+    File-like object for COPY TO output that rolls over to a new file,
+    from open_shard(number), before a row would take the current one past
+    maxrows rows or maxsize bytes (uncompressed). A row on its own that is
+    bigger than maxsize still gets a file to itself. header is written at
+    the top of each file; it counts towards maxsize but not maxrows.
+
+    Each call to write() is taken to be one whole row, the way csv writers
+    make them, unless row_ends gives the offsets in the text where each of
+    the rows in it end. To pick up writing a partly-written file, pass its
+    number, rows and size so far along with the file itself, as f.
+    """
+
+    def __init__(self, open_shard, maxrows=None, maxsize=None, header='',
+                 shard=1, rows=0, size=0, f=None):
+        self.open_shard = open_shard
+        self.maxrows = maxrows
+        self.maxsize = maxsize
+        self.header = header
+        self.shard = shard
+        self.rows = rows
+        self.size = size
+        self.closed_bytes = 0
+        if f is None:
+            self.open(shard)
+        else:
+            self.f = f
+
+    def open(self, shard):
+        self.shard = shard
+        self.f = self.open_shard(shard)
+        self.rows = 0
+        self.size = len(self.header)
+        if self.header:
+            self.f.write(self.header)
+
+    def roll(self):
+        raw = getattr(self.f, 'raw', self.f)
+        self.closed_bytes += raw.tell()
+        self.f.close()
+        self.open(self.shard + 1)
+
+    def write(self, text, row_ends=None):
+        if row_ends is None:
+            row_ends = (len(text),)
+        start = 0
+        i = 0
+        while i < len(row_ends):
+            # the rows from i up to (but not including) end fit in this file
+            end = len(row_ends)
+            if self.maxrows is not None:
+                end = min(end, i + self.maxrows - self.rows)
+            if self.maxsize is not None:
+                end = bisect.bisect_right(row_ends, start + self.maxsize - self.size, i, end)
+            if end <= i:
+                if self.rows > 0:
+                    self.roll()
+                    continue
+                end = i + 1
+            stop = row_ends[end - 1]
+            self.f.write(text[start:stop])
+            self.size += stop - start
+            self.rows += end - i
+            start = stop
+            i = end
+
+    def position(self):
+        """
+        Return (file number, rows, size) for the file being written.
+        """
+        return self.shard, self.rows, self.size
+
+    def tell(self):
+        """
+        The number of bytes written to all the files so far, compressed or
+        not, for progress reports.
+        """
+        return self.closed_bytes + getattr(self.f, 'raw', self.f).tell()
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
@@ -19,6 +19,7 @@ from warnings import warn
 from .cqlhandling import CqlParsingRuleSet, Hint
 from cql.cqltypes import (cql_types, lookup_casstype, CompositeType, UTF8Type,
                           ColumnToCollectionType, CounterColumnType, DateType)
+from cql.marshal import int64_pack
 from . import helptopics
 
 simple_cql_types = set(cql_types)
@@ -33,7 +34,11 @@ except ImportError:
 
 # temporarily have this here until a newer cassandra-dbapi2 is bundled with C*
 class TimestampType(DateType):
-    pass
+    @staticmethod
+    def serialize(timestamp):
+        # round, rather than truncate, so that millisecond values bound in
+        # prepared statements (COPY FROM) survive the trip through float
+        return int64_pack(int(round(timestamp * 1000)))
 
 class UnexpectedTableStructure(UserWarning):
     def __init__(self, msg):
@@ -120,22 +120,9 @@ class CqlParsingRuleSet(pylexotron.ParsingRuleSet):
         return self.whole_match(startsymbol, toklist, srcstr=srcstr)
 
     def cql_split_statements(self, text):
-        tokens = self.lex(text)
-        tokens = self.cql_massage_tokens(tokens)
-        stmts = util.split_list(tokens, lambda t: t[0] == 'endtoken')
-        output = []
-        in_batch = False
-        for stmt in stmts:
-            if in_batch:
-                output[-1].extend(stmt)
-            else:
-                output.append(stmt)
-            if len(stmt) > 2:
-                if stmt[-3][0] == 'K_APPLY':
-                    in_batch = False
-                elif stmt[0][0] == 'K_BEGIN':
-                    in_batch = True
-        return output, in_batch
+        splitter = StatementSplitter(self)
+        splitter.feed(text)
+        return splitter.split()
 
     def cql_complete_single(self, text, partial, init_bindings={}, ignore_case=True,
                             startsymbol='Start'):
@@ -317,3 +304,116 @@ class CqlParsingRuleSet(pylexotron.ParsingRuleSet):
     @staticmethod
     def token_is_word(tok):
         return tok[0] == 'identifier'
+
+class StatementSplitter(object):
+    """
+    Splits CQL text into statements, as lists of tokens massaged like
+    cql_massage_tokens() does, with the statements in a batch joined into
+    one. The text can be fed in any number of pieces, and each is only
+    lexed once, so that a long statement arriving a line at a time takes
+    linear time instead of quadratic.
+
+    Text is only settled once it ends with a newline outside of any string,
+    name or comment: nothing can go on past such a newline, so lexing the
+    text after it on its own gives the same tokens as lexing it all. Until
+    then, everything since the last such newline is lexed again each time.
+    """
+
+    unclosed_token_types = ('unclosedString', 'unclosedName', 'unclosedComment')
+
+    def __init__(self, ruleset):
+        self.ruleset = ruleset
+        self.reset()
+
+    def reset(self):
+        # the text not yet settled, and where it starts in the whole text
+        self.unlexed = ''
+        self.offset = 0
+        self.linenum = 1
+        # tokens of self.unlexed
+        self.tail = []
+        # statements ending in an endtoken so far, and the tokens since then
+        self.statements = []
+        self.current = []
+        self.term_on_nl = False
+        self.in_batch = False
+
+    def feed(self, text):
+        self.unlexed += text
+        try:
+            tokens = self.ruleset.lex(self.unlexed)
+        except pylexotron.LexingError, e:
+            raise pylexotron.LexingError(e.linenum + self.linenum - 1, e.charnum, e.msg)
+        offset = self.offset
+        tokens = [t[:2] + ((t[2][0] + offset, t[2][1] + offset),) for t in tokens]
+        if self.unlexed.endswith('\n') and not (tokens and tokens[-1][0] in self.unclosed_token_types):
+            settled, self.tail = tokens, []
+            self.offset += len(self.unlexed)
+            self.linenum += self.unlexed.count('\n')
+            self.unlexed = ''
+        else:
+            settled, self.tail = [], tokens
+        self.statements, self.current, self.term_on_nl, self.in_batch \
+                = self.add_tokens(settled, self.statements, self.current,
+                                  self.term_on_nl, self.in_batch)
+
+    def add_tokens(self, tokens, statements, current, term_on_nl, in_batch):
+        for t in tokens:
+            if t[0] == 'endline':
+                if not term_on_nl:
+                    # don't put any 'endline' tokens in output
+                    continue
+                t = ('endtoken',) + t[1:]
+            current.append(t)
+            if t[0] == 'endtoken':
+                term_on_nl = False
+                in_batch = self.end_statement(current, statements, in_batch)
+                current = []
+            elif len(current) == 1:
+                # first token in statement; command word
+                term_on_nl = t[1].lower() in self.ruleset.commands_end_with_newline
+        return statements, current, term_on_nl, in_batch
+
+    @staticmethod
+    def end_statement(stmt, statements, in_batch):
+        if in_batch:
+            statements[-1].extend(stmt)
+        else:
+            statements.append(stmt)
+        if len(stmt) > 2:
+            if stmt[-3][0] == 'K_APPLY':
+                in_batch = False
+            elif stmt[0][0] == 'K_BEGIN':
+                in_batch = True
+        return in_batch
+
+    def needs_more(self):
+        """
+        Whether the text so far certainly doesn't end with a complete
+        statement outside of a batch. Cheaper than looking at split().
+        """
+        if self.tail:
+            if self.tail[-1][0] in self.unclosed_token_types:
+                return True
+            statements, in_batch = self.split()
+            while statements and not statements[-1]:
+                statements.pop()
+            return bool(statements) and (in_batch or statements[-1][-1][0] != 'endtoken')
+        return bool(self.current) or self.in_batch
+
+    def split(self):
+        """
+        Returns the statements in the text so far, and whether it ends inside
+        a batch, just as cql_split_statements() would for the whole text.
+        The last statement is the unfinished one, and may be empty.
+        """
+        statements = self.statements[:]
+        if self.in_batch:
+            # don't add to the statements we're keeping
+            statements[-1] = statements[-1][:]
+        current = self.current[:]
+        statements, current, term_on_nl, in_batch \
+                = self.add_tokens(self.tail, statements, current, self.term_on_nl, self.in_batch)
+        in_batch = self.end_statement(current, statements, in_batch)
+        return statements, in_batch
+
@@ -89,6 +89,43 @@ class FormattedValue:
         """
         return self.coloredval + self._pad(width, fill)
 
+class PlainValue(object):
+    """
+    Stands in for a FormattedValue where there's never any color, like
+    output that isn't to a terminal: just the text and its display width,
+    so there's no colored version to build for every value.
+    """
+
+    __slots__ = ('strval', 'displaywidth')
+
+    def __init__(self, strval, displaywidth=None):
+        self.strval = strval
+        if displaywidth is None:
+            displaywidth = len(strval)
+        self.displaywidth = displaywidth
+
+    @property
+    def coloredval(self):
+        return self.strval
+
+    def __len__(self):
+        return len(self.strval)
+
+    def _pad(self, width, fill=' '):
+        if width > self.displaywidth:
+            return fill * (width - self.displaywidth)
+        else:
+            return ''
+
+    def ljust(self, width, fill=' ', color=False):
+        return self.strval + self._pad(width, fill)
+
+    def rjust(self, width, fill=' ', color=False):
+        return self._pad(width, fill) + self.strval
+
+    color_ljust = ljust
+    color_rjust = rjust
+
 DEFAULT_VALUE_COLORS = dict(
     default=YELLOW,
     text=YELLOW,
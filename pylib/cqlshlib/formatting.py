@@ -17,9 +17,11 @@
 import re
 import time
 import binascii
+import calendar
 from collections import defaultdict
+from functools import partial
 from . import wcwidth
-from .displaying import colorme, FormattedValue, DEFAULT_VALUE_COLORS
+from .displaying import colorme, FormattedValue, PlainValue, DEFAULT_VALUE_COLORS
 from cql import cqltypes
 
 unicode_controlchars_re = re.compile(r'[\x00-\x31\x7f-\xa0]')
@@ -67,7 +69,71 @@ def format_by_type(cqltype, val, encoding, colormap=None, addcolor=False,
                         time_format=time_format, float_precision=float_precision,
                         nullval=nullval)
 
-def color_text(bval, colormap, displaywidth=None):
+def compile_formatter(cqltype, encoding, colormap=None, addcolor=False, nullval=None,
+                      time_format=None, float_precision=None, blob_limit=None):
+    """
+    Return a function of a value alone which formats it just as
+    format_by_type() would with the rest of these arguments. The defaults
+    are filled in, and the formatters for the type and its subtypes looked
+    up, once, instead of for every value; use one of these per column when
+    formatting many rows.
+
+    Without addcolor, the values are PlainValues, which skip building the
+    colored text nothing will use. If blob_limit is given, blobs longer than
+    that many bytes are cut short, ending with their full size instead.
+    """
+    if nullval is None:
+        nullval = default_null_placeholder
+    null_value = colorme(nullval, colormap, 'error')
+    if addcolor is False:
+        colormap = empty_colormap
+        null_value = PlainValue(nullval)
+    elif colormap is None:
+        colormap = default_colormap
+    if time_format is None:
+        time_format = default_time_format
+    if float_precision is None:
+        float_precision = default_float_precision
+    format_nonnull = compile_value_formatter(cqltype, encoding=encoding, colormap=colormap,
+                                             time_format=time_format,
+                                             float_precision=float_precision,
+                                             nullval=nullval, blob_limit=blob_limit)
+
+    def formatter(val):
+        if val is None:
+            return null_value
+        return format_nonnull(val)
+    return formatter
+
+def compile_value_formatter(cqltype, quote=False, **kwargs):
+    """
+    Like compile_formatter(), but for format_value(): no null handling, and
+    all of its keyword arguments are required.
+    """
+    compiler = _formatter_compilers.get(cqltype.typename)
+    if compiler is None and cqltype.typename not in _formatters:
+        compiler = compile_default_formatter
+    if compiler is not None:
+        formatter = compiler(cqltype, quote=quote, **kwargs)
+    else:
+        formatter = partial(_formatters[cqltype.typename], subtypes=cqltype.subtypes,
+                            quote=quote, **kwargs)
+    if cqltype.empty_binary_ok:
+        return formatter
+    if is_plain(kwargs['colormap']):
+        empty_value = PlainValue('')
+    else:
+        empty_value = format_value_default('', **kwargs)
+    return lambda val: empty_value if val == '' else formatter(val)
+
+def is_plain(colormap):
+    """
+    Whether values formatted with the given colormap will never be shown
+    in color, so that PlainValues will do.
+    """
+    return colormap is empty_colormap
+
+def color_text(bval, colormap, displaywidth=None, turn_bits_red=None):
     # note that here, we render natural backslashes as just backslashes,
     # in the same color as surrounding text, when using color. When not
     # using color, we need to double up the backslashes so it's not
@@ -79,8 +145,10 @@ def color_text(bval, colormap, displaywidth=None):
 
     if displaywidth is None:
         displaywidth = len(bval)
-    tbr = _make_turn_bits_red_f(colormap['blob'], colormap['text'])
-    coloredval = colormap['text'] + bits_to_turn_red_re.sub(tbr, bval) + colormap['reset']
+    if turn_bits_red is None:
+        turn_bits_red = _make_turn_bits_red_f(colormap['blob'], colormap['text'])
+    coloredval = colormap['text'] + bits_to_turn_red_re.sub(turn_bits_red, bval) \
+               + colormap['reset']
     if colormap['text']:
         displaywidth -= bval.count(r'\\')
     return FormattedValue(bval, coloredval, displaywidth)
@@ -107,10 +175,24 @@ def formatter_for(typname):
         return f
     return registrator
 
+# Mapping cql type base names to functions compiling a formatter for that
+# type, for compile_value_formatter(). Only needed where there's something
+# worth doing once instead of for every value, like looking up the
+# formatters for the subtypes of a collection.
+_formatter_compilers = {}
+
+def formatter_compiler_for(typname):
+    def registrator(f):
+        _formatter_compilers[typname] = f
+        return f
+    return registrator
+
+def blob_hex(val):
+    return '0x' + binascii.hexlify(val)
+
 @formatter_for('blob')
 def format_value_blob(val, colormap, **_):
-    bval = '0x' + ''.join('%02x' % ord(c) for c in val)
-    return colorme(bval, colormap, 'blob')
+    return colorme(blob_hex(val), colormap, 'blob')
 
 def format_python_formatted_type(val, colormap, color, quote=False):
     bval = str(val)
@@ -155,7 +237,7 @@ formatter_for('counter')(format_integer_type)
 
 @formatter_for('timestamp')
 def format_value_timestamp(val, colormap, time_format, quote=False, **_):
-    bval = strftime(time_format, val)
+    bval = timestamp_formatter(time_format)(val)
     if quote:
         bval = "'%s'" % bval
     return colorme(bval, colormap, 'timestamp')
@@ -177,6 +259,79 @@ def strftime(time_format, seconds):
     hours, minutes = divmod(abs(offset) / 60, 60)
     return formatted[:-5] + sign + '{0:0=2}{1:0=2}'.format(hours, minutes)
 
+# formats ending like this, with nothing finer than the hour before it, get
+# their prefix and offset cached by TimestampFormatter
+cacheable_time_format_re = re.compile(r'((?:[^%]|%[aAbBCdDeFhHIjmpuUwWyY%])*)%M:%S%z\Z')
+
+TIMESTAMP_CACHE_SIZE = 1000
+
+# '%M:%S' for each second of an hour
+minutes_and_seconds = ['%02d:%02d' % divmod(n, 60) for n in xrange(3600)]
+
+class TimestampFormatter(object):
+    """
+    Formats timestamps just like strftime(), but for formats like the
+    default one, ending in '%M:%S%z', does the work of localtime() and
+    strftime() once per hour instead of for every value. The UTC offset,
+    and so the %z text, is worked out for each UTC hour, and only used for
+    hours that don't have a DST change in them; the text up to the minutes
+    is kept for each hour of local time. Other formats, and values in
+    hours with a change, go to strftime().
+    """
+
+    def __init__(self, time_format):
+        self.time_format = time_format
+        match = cacheable_time_format_re.match(time_format)
+        self.prefix_format = match.group(1) if match else None
+        # UTC hour: (offset, %z text), or None for hours with a DST change
+        self.offsets = {}
+        # local hour: text up to the minutes
+        self.prefixes = {}
+
+    def __call__(self, seconds):
+        if self.prefix_format is None:
+            return strftime(self.time_format, seconds)
+        # localtime() truncates, rather than flooring, too
+        seconds = int(seconds)
+        utc_hour = seconds // 3600
+        period = self.offsets.get(utc_hour, False)
+        if period is False:
+            if len(self.offsets) >= TIMESTAMP_CACHE_SIZE:
+                self.offsets.clear()
+            period = self.offsets[utc_hour] = self.offset_during(utc_hour * 3600)
+        if period is None:
+            return strftime(self.time_format, seconds)
+        offset, tz = period
+        local_hour, minutes_seconds = divmod(seconds + offset, 3600)
+        prefix = self.prefixes.get(local_hour)
+        if prefix is None:
+            if len(self.prefixes) >= TIMESTAMP_CACHE_SIZE:
+                self.prefixes.clear()
+            prefix = time.strftime(self.prefix_format, time.gmtime(local_hour * 3600))
+            self.prefixes[local_hour] = prefix
+        return prefix + minutes_and_seconds[minutes_seconds] + tz
+
+    @staticmethod
+    def offset_during(start):
+        """
+        The UTC offset and %z text for the hour from start, if they are the
+        same for all of it, otherwise None.
+        """
+        first, last = time.localtime(start), time.localtime(start + 3599)
+        offset = calendar.timegm(first) - start
+        if first.tm_isdst != last.tm_isdst or calendar.timegm(last) - (start + 3599) != offset:
+            return None
+        return offset, strftime('%z', start)
+
+_timestamp_formatters = {}
+
+def timestamp_formatter(time_format):
+    try:
+        return _timestamp_formatters[time_format]
+    except KeyError:
+        formatter = _timestamp_formatters[time_format] = TimestampFormatter(time_format)
+        return formatter
+
 @formatter_for('text')
 def format_value_text(val, encoding, colormap, quote=False, **_):
     escapedval = val.replace(u'\\', u'\\\\')
@@ -196,11 +351,16 @@ def format_simple_collection(subtype, val, lbracket, rbracket, encoding,
                          time_format=time_format, float_precision=float_precision,
                          nullval=nullval, quote=True)
             for sval in val]
+    return join_simple_collection(subs, lbracket, rbracket, colormap)
+
+def join_simple_collection(subs, lbracket, rbracket, colormap):
     bval = lbracket + ', '.join(sval.strval for sval in subs) + rbracket
+    displaywidth = 2 * len(subs) + sum(sval.displaywidth for sval in subs)
+    if is_plain(colormap):
+        return PlainValue(bval, displaywidth)
     lb, sep, rb = [colormap['collection'] + s + colormap['reset']
                    for s in (lbracket, ', ', rbracket)]
     coloredval = lb + sep.join(sval.coloredval for sval in subs) + rb
-    displaywidth = 2 * len(subs) + sum(sval.displaywidth for sval in subs)
     return FormattedValue(bval, coloredval, displaywidth)
 
 @formatter_for('list')
@@ -222,11 +382,129 @@ def format_value_map(val, encoding, colormap, time_format, float_precision, subt
 
     subkeytype, subvaltype = subtypes
     subs = [(subformat(k, subkeytype), subformat(v, subvaltype)) for (k, v) in sorted(val.items())]
+    return join_map(subs, colormap)
+
+def join_map(subs, colormap):
     bval = '{' + ', '.join(k.strval + ': ' + v.strval for (k, v) in subs) + '}'
+    displaywidth = 4 * len(subs) + sum(k.displaywidth + v.displaywidth for (k, v) in subs)
+    if is_plain(colormap):
+        return PlainValue(bval, displaywidth)
     lb, comma, colon, rb = [colormap['collection'] + s + colormap['reset']
                             for s in ('{', ', ', ': ', '}')]
     coloredval = lb \
                + comma.join(k.coloredval + colon + v.coloredval for (k, v) in subs) \
                + rb
-    displaywidth = 4 * len(subs) + sum(k.displaywidth + v.displaywidth for (k, v) in subs)
     return FormattedValue(bval, coloredval, displaywidth)
+
+def compile_colored(colormap, colorkey, to_str):
+    """
+    Compile a formatter for values whose text is just to_str(value), in the
+    given color, with the colors looked up once.
+    """
+    if is_plain(colormap):
+        return lambda val: PlainValue(to_str(val))
+    color = colormap[colorkey]
+    reset = colormap['reset']
+
+    def formatter(val):
+        bval = to_str(val)
+        return FormattedValue(bval, color + bval + reset)
+    return formatter
+
+def quoted(to_str):
+    return lambda val: "'%s'" % to_str(val)
+
+def compile_default_formatter(cqltype, colormap, **_):
+    def to_str(val):
+        escapedval = str(val).replace('\\', '\\\\')
+        return controlchars_re.sub(_show_control_chars, escapedval)
+    if is_plain(colormap):
+        return lambda val: PlainValue(to_str(val))
+    return lambda val: color_text(to_str(val), colormap)
+
+@formatter_compiler_for('blob')
+def compile_blob_formatter(cqltype, colormap, blob_limit=None, **_):
+    if blob_limit is None:
+        return compile_colored(colormap, 'blob', blob_hex)
+
+    def to_str(val):
+        if len(val) <= blob_limit:
+            return blob_hex(val)
+        return '%s... (%d bytes)' % (blob_hex(val[:blob_limit]), len(val))
+    return compile_colored(colormap, 'blob', to_str)
+
+@formatter_compiler_for('int')
+def compile_integer_formatter(cqltype, colormap, **_):
+    return compile_colored(colormap, 'int', str)
+
+formatter_compiler_for('bigint')(compile_integer_formatter)
+formatter_compiler_for('varint')(compile_integer_formatter)
+formatter_compiler_for('counter')(compile_integer_formatter)
+
+@formatter_compiler_for('float')
+def compile_floating_point_formatter(cqltype, colormap, float_precision, **_):
+    return compile_colored(colormap, 'float', lambda val: '%.*g' % (float_precision, val))
+
+formatter_compiler_for('double')(compile_floating_point_formatter)
+
+@formatter_compiler_for('decimal')
+def compile_decimal_formatter(cqltype, colormap, **_):
+    return compile_colored(colormap, 'decimal', str)
+
+@formatter_compiler_for('uuid')
+def compile_uuid_formatter(cqltype, colormap, **_):
+    return compile_colored(colormap, 'uuid', str)
+
+formatter_compiler_for('timeuuid')(compile_uuid_formatter)
+
+@formatter_compiler_for('boolean')
+def compile_boolean_formatter(cqltype, colormap, **_):
+    return compile_colored(colormap, 'boolean', str)
+
+@formatter_compiler_for('inet')
+def compile_inet_formatter(cqltype, colormap, quote=False, **_):
+    return compile_colored(colormap, 'inet', quoted(str) if quote else str)
+
+@formatter_compiler_for('timestamp')
+def compile_timestamp_formatter(cqltype, colormap, time_format, quote=False, **_):
+    to_str = timestamp_formatter(time_format)
+    return compile_colored(colormap, 'timestamp', quoted(to_str) if quote else to_str)
+
+@formatter_compiler_for('text')
+def compile_text_formatter(cqltype, encoding, colormap, quote=False, **_):
+    plain = is_plain(colormap)
+    turn_bits_red = _make_turn_bits_red_f(colormap['blob'], colormap['text'])
+
+    def formatter(val):
+        escapedval = val.replace(u'\\', u'\\\\')
+        escapedval = unicode_controlchars_re.sub(_show_control_chars, escapedval)
+        bval = escapedval.encode(encoding, 'backslashreplace')
+        if quote:
+            bval = "'%s'" % bval
+        displaywidth = wcwidth.wcswidth(bval.decode(encoding))
+        if plain:
+            return PlainValue(bval, displaywidth)
+        return color_text(bval, colormap, displaywidth, turn_bits_red)
+    return formatter
+
+formatter_compiler_for('varchar')(compile_text_formatter)
+
+@formatter_compiler_for('list')
+def compile_list_formatter(cqltype, colormap, quote=False, **kwargs):
+    format_item = compile_value_formatter(cqltype.subtypes[0], quote=True, colormap=colormap,
+                                          **kwargs)
+    return lambda val: join_simple_collection(map(format_item, val), '[', ']', colormap)
+
+@formatter_compiler_for('set')
+def compile_set_formatter(cqltype, colormap, quote=False, **kwargs):
+    format_item = compile_value_formatter(cqltype.subtypes[0], quote=True, colormap=colormap,
+                                          **kwargs)
+    return lambda val: join_simple_collection(map(format_item, sorted(val)), '{', '}', colormap)
+
+@formatter_compiler_for('map')
+def compile_map_formatter(cqltype, colormap, quote=False, **kwargs):
+    format_key, format_val = [compile_value_formatter(subtype, quote=True, colormap=colormap,
+                                                      **kwargs)
+                              for subtype in cqltype.subtypes]
+    return lambda val: join_map([(format_key(k), format_val(v)) for (k, v) in sorted(val.items())],
+                                colormap)
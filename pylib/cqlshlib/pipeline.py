@@ -0,0 +1,123 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Running independent statements several at a time, each on a connection
+of its own, instead of waiting for the response to one before sending
+the next. The cql driver only does one request at a time per connection,
+so each statement in flight has a thread and a connection to itself.
+"""
+
+import threading
+from Queue import Queue
+
+class StatementPipeline(object):
+    """
+    Keeps up to size statements in flight at once. Each worker thread
+    opens a connection with connect() the first time it's needed, and runs
+    statements on its cursor with execute(cursor, statement, printerr=f),
+    which should pass any errors to f. report(tag, errors) is then called
+    in the submitting thread with the tag each statement was submitted
+    with and the errors it had, in the order the statements were submitted,
+    whatever order they finish in.
+    """
+
+    def __init__(self, size, connect, execute, report):
+        self.size = size
+        self.connect = connect
+        self.execute = execute
+        self.report = report
+        self.inqueue = Queue()
+        self.outqueue = Queue()
+        self.inflight = 0
+        self.workers = []
+        # results which came back ahead of those of earlier statements
+        self.finished = {}
+        self.submitted = self.reported = 0
+
+    def submit(self, tag, statement, use=None, consistency_level=None):
+        """
+        Send a statement off to be run at the given consistency level, once
+        the connection it's run on has done the USE statement use. If size
+        statements are already in flight, waits for one of them first.
+        """
+        while self.inflight >= self.size:
+            self.collect()
+        if self.inflight == len(self.workers):
+            self.start_worker()
+        self.inqueue.put((self.submitted, tag, statement, use, consistency_level))
+        self.submitted += 1
+        self.inflight += 1
+
+    def collect(self):
+        seq, tag, errors = self.outqueue.get()
+        self.inflight -= 1
+        self.finished[seq] = (tag, errors)
+        while self.reported in self.finished:
+            tag, errors = self.finished.pop(self.reported)
+            self.reported += 1
+            self.report(tag, errors)
+
+    def drain(self):
+        """
+        Wait for all the statements in flight to finish.
+        """
+        while self.inflight:
+            self.collect()
+
+    def close(self):
+        self.drain()
+        for worker in self.workers:
+            self.inqueue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def start_worker(self):
+        worker = threading.Thread(target=self.work)
+        # don't hold up exiting if a statement never comes back
+        worker.setDaemon(True)
+        worker.start()
+        self.workers.append(worker)
+
+    def work(self):
+        conn = cursor = None
+        current_use = None
+        try:
+            while True:
+                item = self.inqueue.get()
+                if item is None:
+                    break
+                seq, tag, statement, use, consistency_level = item
+                errors = []
+                try:
+                    if cursor is None:
+                        conn = self.connect()
+                        cursor = conn.cursor()
+                    if use != current_use:
+                        current_use = None
+                        if use is None or self.execute(cursor, use, printerr=errors.append):
+                            current_use = use
+                    if use == current_use:
+                        if consistency_level is not None:
+                            cursor.consistency_level = consistency_level
+                        self.execute(cursor, statement, printerr=errors.append)
+                except Exception, e:
+                    errors.append(str(e))
+                self.outqueue.put((seq, tag, errors))
+        finally:
+            if conn is not None:
+                conn.close()
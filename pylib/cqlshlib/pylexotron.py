@@ -51,19 +51,37 @@ class Hint:
 def is_hint(x):
     return isinstance(x, Hint)
 
-class ParseContext:
+class ParseContext(object):
     """
     These are meant to be immutable, although it would be something of a
     pain to enforce that in python.
+
+    All the contexts for one parse share the same tuple of tokens; each only
+    keeps the offset of the first token it has not matched, so that moving
+    along doesn't mean copying what's been matched and what's left.
     """
 
-    def __init__(self, ruleset, bindings, matched, remainder, productionname):
+    def __init__(self, ruleset, bindings, tokens, offset, productionname):
         self.ruleset = ruleset
         self.bindings = bindings
-        self.matched = matched
-        self.remainder = remainder
+        self.tokens = tokens
+        self.offset = offset
         self.productionname = productionname
 
+    @property
+    def matched(self):
+        return self.tokens[:self.offset]
+
+    @property
+    def remainder(self):
+        return self.tokens[self.offset:]
+
+    def at_end(self):
+        return self.offset >= len(self.tokens)
+
+    def next_token(self):
+        return self.tokens[self.offset]
+
     def get_production_by_name(self, name):
         return self.ruleset[name]
 
@@ -76,17 +94,16 @@ class ParseContext:
     def with_binding(self, name, val):
         newbinds = self.bindings.copy()
         newbinds[name] = val
-        return self.__class__(self.ruleset, newbinds, self.matched,
-                              self.remainder, self.productionname)
+        return self.__class__(self.ruleset, newbinds, self.tokens,
+                              self.offset, self.productionname)
 
     def with_match(self, num):
-        return self.__class__(self.ruleset, self.bindings,
-                              self.matched + self.remainder[:num],
-                              self.remainder[num:], self.productionname)
+        return self.__class__(self.ruleset, self.bindings, self.tokens,
+                              self.offset + num, self.productionname)
 
     def with_production_named(self, newname):
-        return self.__class__(self.ruleset, self.bindings, self.matched,
-                              self.remainder, newname)
+        return self.__class__(self.ruleset, self.bindings, self.tokens,
+                              self.offset, newname)
 
     def extract_orig(self, tokens=None):
         if tokens is None:
@@ -112,14 +129,14 @@ class matcher:
         raise NotImplementedError
 
     def match_with_results(self, ctxt, completions):
-        matched_before = len(ctxt.matched)
+        matched_before = ctxt.offset
         newctxts = self.match(ctxt, completions)
-        return [(newctxt, newctxt.matched[matched_before:]) for newctxt in newctxts]
+        return [(newctxt, newctxt.tokens[matched_before:newctxt.offset]) for newctxt in newctxts]
 
     @staticmethod
     def try_registered_completion(ctxt, symname, completions):
         debugging = ctxt.get_binding('*DEBUG*', False)
-        if ctxt.remainder or completions is None:
+        if completions is None or not ctxt.at_end():
             return False
         try:
             completer = ctxt.get_completer(symname)
@@ -228,8 +245,8 @@ class regex_rule(terminal_matcher):
         self.re = re.compile(pat + '$', re.I | re.S)
 
     def match(self, ctxt, completions):
-        if ctxt.remainder:
-            if self.re.match(ctxt.remainder[0][1]):
+        if not ctxt.at_end():
+            if self.re.match(ctxt.next_token()[1]):
                 return [ctxt.with_match(1)]
         elif completions is not None:
             completions.add(Hint('<%s>' % ctxt.productionname))
@@ -248,8 +265,8 @@ class text_match(terminal_matcher):
             print "bad syntax %r" % (text,)
 
     def match(self, ctxt, completions):
-        if ctxt.remainder:
-            if self.arg.lower() == ctxt.remainder[0][1].lower():
+        if not ctxt.at_end():
+            if self.arg.lower() == ctxt.next_token()[1].lower():
                 return [ctxt.with_match(1)]
         elif completions is not None:
             completions.add(self.arg)
@@ -264,8 +281,8 @@ class text_match(terminal_matcher):
 
 class case_match(text_match):
     def match(self, ctxt, completions):
-        if ctxt.remainder:
-            if self.arg == ctxt.remainder[0][1]:
+        if not ctxt.at_end():
+            if self.arg == ctxt.next_token()[1]:
                 return [ctxt.with_match(1)]
         elif completions is not None:
             completions.add(self.arg)
@@ -289,8 +306,8 @@ class terminal_type_matcher(matcher):
         self.submatcher = submatcher
 
     def match(self, ctxt, completions):
-        if ctxt.remainder:
-            if ctxt.remainder[0][0] == self.tokentype:
+        if not ctxt.at_end():
+            if ctxt.next_token()[0] == self.tokentype:
                 return [ctxt.with_match(1)]
         elif completions is not None:
             self.submatcher.match(ctxt, completions)
@@ -439,7 +456,7 @@ class ParsingRuleSet:
     def parse(self, startsymbol, tokens, init_bindings=None):
         if init_bindings is None:
             init_bindings = {}
-        ctxt = ParseContext(self.ruleset, init_bindings, (), tuple(tokens), startsymbol)
+        ctxt = ParseContext(self.ruleset, init_bindings, tuple(tokens), 0, startsymbol)
         pattern = self.ruleset[startsymbol]
         return pattern.match(ctxt, None)
 
@@ -448,7 +465,7 @@ class ParsingRuleSet:
         if srcstr is not None:
             bindings['*SRC*'] = srcstr
         for c in self.parse(startsymbol, tokens, init_bindings=bindings):
-            if not c.remainder:
+            if c.at_end():
                 return c
 
     def lex_and_parse(self, text, startsymbol='Start'):
@@ -461,7 +478,7 @@ class ParsingRuleSet:
     def complete(self, startsymbol, tokens, init_bindings=None):
         if init_bindings is None:
             init_bindings = {}
-        ctxt = ParseContext(self.ruleset, init_bindings, (), tuple(tokens), startsymbol)
+        ctxt = ParseContext(self.ruleset, init_bindings, tuple(tokens), 0, startsymbol)
         pattern = self.ruleset[startsymbol]
         if init_bindings.get('*DEBUG*', False):
             completions = Debugotron(stream=sys.stderr)
@@ -0,0 +1,122 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import time
+
+import cql
+
+# how the cql driver reports thrift's UnavailableException and
+# TimedOutException, both of which it turns into a cql.OperationalError
+UNAVAILABLE_MESSAGE = 'Unable to complete request: one or more nodes were unavailable.'
+TIMED_OUT_MESSAGE = 'Request did not complete within rpc_timeout.'
+
+def is_unavailable(err):
+    return isinstance(err, cql.OperationalError) and str(err) == UNAVAILABLE_MESSAGE
+
+def is_timeout(err):
+    return isinstance(err, cql.OperationalError) and str(err) == TIMED_OUT_MESSAGE
+
+def is_overloaded(err):
+    """
+    Whether an error from the cql driver means the cluster couldn't keep
+    up with a request, so it's worth trying again after backing off.
+    """
+    return is_unavailable(err) or is_timeout(err)
+
+def backoff_delay(trynum, base=0.5, maximum=16.0):
+    """
+    How long to wait before the given try of a request, doubling with each
+    one. The delay is randomized a little, so that several clients backing
+    off at once don't all come back at the same moment.
+    """
+    return min(maximum, base * 2 ** (trynum - 2)) * random.uniform(0.5, 1.0)
+
+class TokenBucket(object):
+    """
+    Hands out rate tokens a second, letting up to a second's worth of them
+    build up while they aren't being taken. Time is told by clock() and
+    passed by sleep(seconds).
+    """
+
+    def __init__(self, rate, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.tokens = max(1.0, self.rate)
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+
+    def take(self, n=1):
+        """
+        Take n tokens, first waiting for them if there aren't enough. More
+        than a second's worth can be taken at once; the wait is just longer.
+        """
+        now = self.clock()
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= n
+        if self.tokens < 0:
+            self.sleep(-self.tokens / self.rate)
+
+class Throttle(object):
+    """
+    Paces the rows one process sends to the cluster: no more than maxrate
+    a second, if that's given, and fewer whenever the cluster reports being
+    overloaded. Each time that happens (at most once a second) the rate is
+    halved; it then creeps back up by a twentieth of each row written.
+    """
+
+    min_rate = 1.0
+    increase_per_row = 0.05
+
+    def __init__(self, maxrate=None, clock=time.time, sleep=time.sleep):
+        self.maxrate = maxrate
+        self.clock = clock
+        self.sleep = sleep
+        self.bucket = None
+        if maxrate is not None:
+            self.bucket = TokenBucket(maxrate, clock, sleep)
+        self.started = clock()
+        self.written = 0
+        self.last_cut = 0
+
+    def wait(self, numrows=1):
+        if self.bucket is not None:
+            self.bucket.take(numrows)
+
+    def succeeded(self, numrows=1):
+        self.written += numrows
+        bucket = self.bucket
+        if bucket is not None and (self.maxrate is None or bucket.rate < self.maxrate):
+            bucket.rate += numrows * self.increase_per_row
+            if self.maxrate is not None:
+                bucket.rate = min(self.maxrate, bucket.rate)
+
+    def overloaded(self, trynum):
+        """
+        Note that the cluster is overloaded, and wait a while before the
+        given try of the request that found out.
+        """
+        now = self.clock()
+        if self.bucket is None:
+            # no limit until now; start from what we've managed so far
+            elapsed = now - self.started
+            rate = self.written / elapsed if elapsed > 0 else self.min_rate
+            self.bucket = TokenBucket(max(self.min_rate, rate), self.clock, self.sleep)
+        if now - self.last_cut >= 1.0:
+            self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+            self.last_cut = now
+        self.sleep(backoff_delay(trynum))
@@ -0,0 +1,226 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Reading the statements of a script, as run by SOURCE and cqlsh --file,
+straight from the file: it is read in large blocks, each lexed in one go,
+instead of being fed to the shell a line at a time.
+"""
+
+from .cqlhandling import StatementSplitter
+from .pylexotron import LexingError
+
+BLOCK_SIZE = 64 * 1024
+
+class ScriptReader(object):
+    """
+    Reads the statements of a script from the file f. Iterating gives
+    (srcstr, statements) for each group of statements the shell would run
+    together reading f a line at a time: those up to the end of the first
+    line on which they are all complete, each a list of tokens as
+    cql_split_statements() would give them for srcstr, batches included.
+    If some text can't be lexed, a LexingError is raised instead for the
+    group it is in, relative to its srcstr, and the group is skipped up
+    to the end of that line.
+
+    Like a file, readline() gives the next line after the statements read
+    so far, for commands like COPY FROM STDIN which read the lines that
+    follow them. lineno is the number of the next line to be read, and
+    srcstr the text of the last group. Once the end of f is reached,
+    incomplete says whether it came partway through a statement.
+    """
+
+    def __init__(self, ruleset, f, blocksize=BLOCK_SIZE):
+        self.ruleset = ruleset
+        self.f = f
+        self.name = getattr(f, 'name', '<script>')
+        self.blocksize = blocksize
+        # the text read and not yet consumed starts at self.pos, and has
+        # been lexed up to self.lexend, the end of its last complete line
+        self.text = ''
+        self.pos = 0
+        self.lexend = 0
+        self.tokens = None
+        self.tokpos = 0
+        # the end of the line which could not be lexed, when self.lexend
+        # has been cut short at its start
+        self.errorline_end = None
+        self.eof = False
+        self.lineno = 1
+        self.srcstr = ''
+        self.incomplete = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while True:
+            if self.eof and self.pos == len(self.text):
+                raise StopIteration
+            if self.tokens is None:
+                self.lex()
+            found = self.find_group()
+            if found is None:
+                if self.errorline_end is not None:
+                    self.skip_error_line()
+                else:
+                    self.lex(more=True)
+            elif found[1]:
+                return found
+
+    def readline(self):
+        end = self.text.find('\n', self.pos) + 1
+        if not end:
+            self.read_lines()
+            end = self.text.find('\n', self.pos) + 1 or len(self.text)
+        line = self.text[self.pos:end]
+        self.pos = end
+        if line:
+            self.lineno += 1
+        # what follows has to be lexed afresh
+        self.tokens = None
+        self.errorline_end = None
+        return line
+
+    def read_lines(self, more=False):
+        """
+        Drop the text consumed so far, and read from f until the rest has
+        a complete line, or a line past self.lexend if more, or f ends.
+        Reads are at least as big as the text left, so that a statement
+        running past the end of a block is lexed again only a few times.
+        """
+        text = self.text[self.pos:]
+        want = self.lexend - self.pos + 1 if more else 1
+        have = text.rfind('\n') + 1
+        while have < want and not self.eof:
+            data = self.f.read(max(self.blocksize, len(text)))
+            if not data:
+                self.eof = True
+                break
+            nl = data.rfind('\n')
+            if nl >= 0:
+                have = len(text) + nl + 1
+            text += data
+        self.text = text
+        self.pos = 0
+        self.lexend = len(text) if self.eof else have
+
+    def lex(self, more=False):
+        self.read_lines(more)
+        self.tokpos = 0
+        try:
+            self.tokens = self.ruleset.lex(self.text[:self.lexend])
+        except LexingError, e:
+            # groups before the line with the error still count; the
+            # one it's in is only found to be bad at the end of that line
+            start = 0
+            for n in xrange(e.linenum - 1):
+                start = self.text.index('\n', start) + 1
+            self.errorline_end = self.text.find('\n', start, self.lexend) + 1 or self.lexend
+            self.lexend = start
+            self.tokens = self.ruleset.lex(self.text[:start])
+
+    def skip_error_line(self):
+        end = self.errorline_end
+        self.errorline_end = None
+        self.tokens = None
+        # raises the error again, relative to the group it's in
+        self.ruleset.lex(self.take(end, 0, [])[0])
+
+    def find_group(self):
+        """
+        Find the end of the group of statements starting at self.pos, and
+        return (srcstr, statements) for it, or None if the text lexed so
+        far ends before it does.
+        """
+        text = self.text
+        tokens = self.tokens
+        commands_end_with_newline = self.ruleset.commands_end_with_newline
+        statements = []
+        current = []
+        term_on_nl = False
+        in_batch = False
+        # where the statements so far are all complete, if they are
+        complete_at = self.pos
+        i = self.tokpos
+        while True:
+            if complete_at is not None:
+                if i < len(tokens):
+                    nextstart = tokens[i][2][0]
+                else:
+                    nextstart = self.lexend
+                lineend = self.line_end(complete_at, nextstart)
+                if lineend is not None:
+                    return self.take(lineend, i, statements)
+                if i == len(tokens):
+                    break
+                if tokens[i][0] == 'endline':
+                    return self.take(tokens[i][2][1], i + 1, statements)
+            elif i == len(tokens):
+                break
+            t = tokens[i]
+            i += 1
+            if t[0] == 'endline':
+                if not term_on_nl:
+                    continue
+                t = ('endtoken',) + t[1:]
+            current.append(t)
+            if t[0] == 'endtoken':
+                term_on_nl = False
+                in_batch = StatementSplitter.end_statement(current, statements, in_batch)
+                current = []
+                if not in_batch:
+                    if t[1] == '\n':
+                        return self.take(t[2][1], i, statements)
+                    complete_at = t[2][1]
+            else:
+                if len(current) == 1:
+                    # first token in statement; command word
+                    term_on_nl = t[1].lower() in commands_end_with_newline
+                complete_at = None
+        if not self.eof or self.errorline_end is not None:
+            return None
+        self.incomplete = complete_at is None
+        if self.incomplete:
+            statements = []
+        return self.take(self.lexend, i, statements)
+
+    def line_end(self, start, end):
+        """
+        The end of the first line ending between two tokens, in the text
+        from start to end, which has only whitespace and comments. A
+        newline inside a /* comment */ doesn't count.
+        """
+        nl = self.text.find('\n', start, end)
+        while nl >= 0:
+            if not self.ruleset.lex(self.text[start:nl + 1]):
+                return nl + 1
+            nl = self.text.find('\n', nl + 1, end)
+        return None
+
+    def take(self, end, tokpos, statements):
+        start = self.pos
+        srcstr = self.text[start:end]
+        self.lineno += srcstr.count('\n')
+        if self.eof and end == len(self.text) and srcstr and not srcstr.endswith('\n'):
+            self.lineno += 1
+        self.pos = end
+        self.tokpos = tokpos
+        self.srcstr = srcstr
+        if start:
+            statements = [[t[:2] + ((t[2][0] - start, t[2][1] - start),) for t in st]
+                          for st in statements]
+        return srcstr, statements
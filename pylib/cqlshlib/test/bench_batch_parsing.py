@@ -0,0 +1,63 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Benchmark for parsing long statements: how long the whole parse of a
+# BATCH of INSERTs and DELETEs takes, as the shell does before running it.
+# Run with
+#
+#     python -m cqlshlib.test.bench_batch_parsing [numstatements ...]
+#
+# with pylib on the PYTHONPATH.
+
+import sys
+import time
+
+from cqlshlib.cql3handling import CqlRuleSet
+
+def make_batch(numstatements):
+    statements = []
+    for n in range(numstatements):
+        if n % 2:
+            statements.append("INSERT INTO ks.tbl (a, b, c) VALUES (%d, 'text %d', 3) "
+                              "USING TTL 10;" % (n, n))
+        else:
+            statements.append("DELETE b FROM ks.tbl WHERE a = %d AND d IN (1, 2);" % n)
+    return 'BEGIN BATCH\n' + '\n'.join(statements) + '\nAPPLY BATCH;'
+
+def best_time(text, tokens, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        parsed = CqlRuleSet.cql_whole_parse_tokens(tokens, srcstr=text)
+        elapsed = time.time() - start
+        if parsed is None:
+            raise ValueError("batch didn't parse")
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main(sizes=(10, 100, 1000)):
+    for numstatements in sizes:
+        text = make_batch(numstatements)
+        tokens = CqlRuleSet.cql_massage_tokens(CqlRuleSet.lex(text))
+        print '%5d statements, %6d tokens %8.3fs' \
+              % (numstatements, len(tokens), best_time(text, tokens))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(map(int, sys.argv[1:]))
+    else:
+        main()
@@ -0,0 +1,87 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Micro-benchmark for the per-record work of COPY FROM: how long the
+# inserters take to turn a CSV record of a 100-column table into a query,
+# or into a prepared statement and its parameters, with nothing sent
+# anywhere. Run with
+#
+#     python -m cqlshlib.test.bench_copy_inserters [numrows]
+#
+# with pylib and the cql driver on the PYTHONPATH.
+
+import sys
+import time
+
+from cqlshlib import copyutil
+from cqlshlib.cql3handling import CqlTableDef
+
+MARSHAL = 'org.apache.cassandra.db.marshal.'
+
+# column types, in turn, and a value of each
+column_types = (
+    ('Int32Type', '42'),
+    ('UTF8Type', 'some text'),
+    ('LongType', '1234567890123'),
+    ('DoubleType', '3.25'),
+    ('TimestampType', '2013-06-01 12:34:56'),
+)
+
+class FakeCursor(object):
+    supports_prepared_queries = True
+
+    def prepare_query(self, query):
+        return query
+
+def make_layout(numcolumns):
+    layout = {u'keyspace_name': u'ks', u'columnfamily_name': u'tbl',
+              u'comparator': MARSHAL + 'CompositeType(%sUTF8Type)' % MARSHAL,
+              u'compaction_strategy_options': u'{}', u'compression_parameters': u'{}'}
+    coldefs = [{u'column_name': u'k', u'validator': MARSHAL + 'Int32Type',
+                u'type': u'partition_key', u'component_index': None,
+                u'index_name': None, u'index_type': None}]
+    for n in range(numcolumns - 1):
+        coldefs.append({u'column_name': u'c%02d' % n,
+                        u'validator': MARSHAL + column_types[n % len(column_types)][0],
+                        u'type': u'regular', u'component_index': None,
+                        u'index_name': None, u'index_type': None})
+    return CqlTableDef.from_layout(layout, coldefs)
+
+def best_time(f, rows, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for row in rows:
+            f(row)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main(numrows=2000, numcolumns=100):
+    layout = make_layout(numcolumns)
+    columns = [c.name for c in layout.columns]
+    row = ['1'] + [column_types[n % len(column_types)][1] for n in range(numcolumns - 1)]
+    rows = [list(row) for _ in range(numrows)]
+    literal = copyutil.LiteralInserter(FakeCursor(), layout, columns, '')
+    prepared = copyutil.PreparedInserter(FakeCursor(), layout, columns, '')
+    print '%d rows of %d columns, best of 5:' % (numrows, numcolumns)
+    for name, f in (('LiteralInserter.make_query', literal.make_query),
+                    ('PreparedInserter.bind_row', prepared.bind_row)):
+        print '  %-28s %6.1f us/row' % (name, best_time(f, rows) / numrows * 1e6)
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:2]))
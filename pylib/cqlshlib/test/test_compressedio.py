@@ -0,0 +1,128 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import with_statement
+
+import bz2
+import gzip
+import os
+import random
+import shutil
+import tempfile
+
+from .basecase import BaseTestCase, unittest
+from cqlshlib import compressedio
+
+def sample_text(numlines, seed=0):
+    rand = random.Random(seed)
+    return ''.join('%d,%s,"%s"\n' % (n, rand.random(), 'x' * rand.randint(0, 200))
+                   for n in range(numlines))
+
+class TestCompressedIO(BaseTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def write(self, fname, compression, text, pieces=7):
+        f = compressedio.open_output(fname, compression)
+        step = len(text) // pieces + 1
+        for start in range(0, len(text), step):
+            f.write(text[start:start + step])
+        f.close()
+
+    def check_round_trip(self, compression):
+        ext = compressedio.compressions[compression][0]
+        fname = self.path('data.csv' + ext)
+        # bigger than a block, compressed or not
+        text = sample_text(5000)
+        self.assertTrue(len(text) > 4 * compressedio.BLOCK_SIZE)
+        self.write(fname, compression, text)
+        self.assertEqual(compressedio.compression_for(fname), compression)
+        f = compressedio.open_input(fname, compression)
+        self.assertEqual(list(f), text.splitlines(True))
+        self.assertEqual(f.tell(), len(text))
+        f.close()
+        # reading in pieces, and skipping ahead
+        f = compressedio.open_input(fname, compression)
+        self.assertEqual(f.read(10), text[:10])
+        self.assertEqual(f.readline(), text[10:text.index('\n') + 1])
+        f.seek(100000)
+        self.assertEqual(f.tell(), 100000)
+        self.assertEqual(f.read(), text[100000:])
+        self.assertEqual(f.read(), '')
+        self.assertRaises(IOError, f.seek, 10)
+        f.close()
+
+    def test_gzip(self):
+        self.check_round_trip('gzip')
+        # and readable by gzip itself
+        self.assertEqual(gzip.open(self.path('data.csv.gz')).read(), sample_text(5000))
+
+    def test_bzip2(self):
+        self.check_round_trip('bzip2')
+        self.assertEqual(bz2.BZ2File(self.path('data.csv.bz2')).read(), sample_text(5000))
+
+    @unittest.skipIf(compressedio.lzma is None, 'needs the lzma module')
+    def test_xz(self):
+        self.check_round_trip('xz')
+
+    def test_concatenated(self):
+        # as from 'cat a.gz b.gz', or pigz and pbzip2
+        texts = [sample_text(n, seed=n) for n in (3, 0, 2000, 1)]
+        for compression in ('gzip', 'bzip2'):
+            fname = self.path('cat' + compressedio.compressions[compression][0])
+            with open(fname, 'wb') as out:
+                for n, text in enumerate(texts):
+                    part = self.path('part%d' % n)
+                    self.write(part, compression, text)
+                    out.write(open(part, 'rb').read())
+            f = compressedio.open_input(fname, compression)
+            self.assertEqual(f.read(), ''.join(texts), msg=compression)
+            f.close()
+
+    def test_not_compressed(self):
+        fname = self.path('plain.gz')
+        with open(fname, 'wb') as f:
+            f.write('not gzip at all\n' * 100)
+        f = compressedio.open_input(fname, 'gzip')
+        self.assertRaises(IOError, f.read)
+        f.close()
+
+    def test_compression_for(self):
+        for fname, name, expected in (('x.csv', None, None), ('x.csv.gz', None, 'gzip'),
+                                      ('X.CSV.BZ2', None, 'bzip2'), ('x.gz', 'none', None),
+                                      ('x.csv', 'GZIP', 'gzip'), (None, None, None),
+                                      (None, 'bzip2', 'bzip2')):
+            self.assertEqual(compressedio.compression_for(fname, name), expected,
+                             msg='%r %r' % (fname, name))
+        self.assertRaises(ValueError, compressedio.compression_for, 'x.csv', 'zip')
+        if compressedio.lzma is None:
+            self.assertRaises(ValueError, compressedio.compression_for, 'x.csv.xz')
+        else:
+            self.assertEqual(compressedio.compression_for('x.csv.xz'), 'xz')
+
+    def test_split_extension(self):
+        for fname, compression, expected in (('x.csv.gz', 'gzip', ('x.csv', '.gz')),
+                                             ('x.csv.GZ', 'gzip', ('x.csv', '.GZ')),
+                                             ('x.csv', 'gzip', ('x.csv', '')),
+                                             ('x.csv.bz2', 'bzip2', ('x.csv', '.bz2')),
+                                             ('x.csv.gz', None, ('x.csv.gz', '')),
+                                             ('dir.gz/x', 'gzip', ('dir.gz/x', ''))):
+            self.assertEqual(compressedio.split_extension(fname, compression), expected,
+                             msg=fname)
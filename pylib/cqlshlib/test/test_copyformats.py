@@ -0,0 +1,127 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from cStringIO import StringIO
+from decimal import Decimal
+from uuid import UUID
+
+from .basecase import BaseTestCase, cql
+from cqlshlib import copyformats, copyutil
+
+MARSHAL = 'org.apache.cassandra.db.marshal.'
+
+def casstype(name):
+    return cql.cqltypes.lookup_casstype(MARSHAL + name % {'m': MARSHAL})
+
+tsv_rows = (
+    ['a', 'b', 'c'],
+    ['tab\there', 'new\nline', 'back\\slash'],
+    ['\\t is not a tab', 'ends in \\', '\r\n'],
+    ['', 'NULL', ''],
+    ["['a\tb', 'c''d']", "{'k': 'v\\n'}", '{1, 2}'],
+    ['\xc3\xa9', '\\\\\t\\', '\t'],
+)
+
+# column types, and rows of values as the cql driver gives them
+json_columns = (
+    ('Int32Type', [0, -5, None]),
+    ('LongType', [2 ** 40, None, -1]),
+    ('UTF8Type', [u'', None, u'tab\t"quote"\n\\ \xe9\u4e2d']),
+    ('AsciiType', ['plain', '', None]),
+    ('BytesType', ['\x00\xff', '', None]),
+    ('DoubleType', [1.5, float('inf'), float('nan')]),
+    ('FloatType', [float('-inf'), 0.25, None]),
+    ('DecimalType', [Decimal('1.50'), Decimal('NaN'), Decimal('-Infinity')]),
+    ('BooleanType', [True, False, None]),
+    ('UUIDType', [UUID(int=1), None, UUID('0d7b7cf0-3a0a-11e3-aa6e-0800200c9a66')]),
+    ('DateType', [0.0, 1381234567.123, None]),
+    ('ListType(%(m)sUTF8Type)', [[u'a', u"it's", u'x, y]'], [], None]),
+    ('SetType(%(m)sInt32Type)', [set([3, 1]), set(), None]),
+    ('MapType(%(m)sUTF8Type,%(m)sDoubleType)', [{u'a': 1.0, u"b'": float('nan')}, {}, None]),
+    ('MapType(%(m)sInt32Type,%(m)sDateType)', [{1: 0.0}, None, {2: 1e9}]),
+)
+
+NULL = 'null value'
+
+def comparable(val):
+    # NaN isn't equal to itself
+    if isinstance(val, (float, Decimal)) and val != val:
+        return 'NaN'
+    if isinstance(val, dict):
+        return dict((k, comparable(v)) for (k, v) in val.iteritems())
+    return val
+
+class TestTsv(BaseTestCase):
+    def test_round_trip(self):
+        out = StringIO()
+        writer = copyformats.TsvWriter(out)
+        for row in tsv_rows:
+            writer.writerow(row)
+        text = out.getvalue()
+        self.assertEqual(text.count('\n'), len(tsv_rows))
+        self.assertEqual(list(copyformats.TsvReader(StringIO(text))), map(list, tsv_rows))
+
+    def test_unescape(self):
+        reader = copyformats.TsvReader(['a\\tb\t\\\\n\t\\x\t\\r\\n\r\n'])
+        self.assertEqual(list(reader), [['a\tb', '\\n', 'x', '\r\n']])
+        self.assertEqual(reader.line_num, 1)
+
+class TestJsonLines(BaseTestCase):
+    def round_trip(self, types, rows):
+        columns = ['c%d' % n for n in range(len(types))]
+        format_row = copyformats.make_json_row_formatter()
+        out = StringIO()
+        writer = copyformats.JsonLinesWriter(out, columns)
+        for row in rows:
+            writer.writerow(format_row(row, types))
+        text = out.getvalue()
+        # COPY TO writes JSON proper, which anything can read
+        for line in text.splitlines():
+            json.loads(line, parse_constant=lambda name: self.fail('%s in %s' % (name, line)))
+        reader = copyformats.JsonLinesReader(StringIO(text), columns, types, NULL)
+        converters = map(copyutil.compile_converter, types)
+        return [[None if val == NULL else convert(val) for (convert, val) in zip(converters, row)]
+                for row in reader]
+
+    def test_round_trip(self):
+        types = [casstype(name) for name, values in json_columns]
+        rows = zip(*[values for name, values in json_columns])
+        got = self.round_trip(types, rows)
+        self.assertEqual(len(got), len(rows))
+        for row, got_row in zip(rows, got):
+            for (name, values), val, got_val in zip(json_columns, row, got_row):
+                self.assertEqual(comparable(got_val), comparable(val), msg='%s %r' % (name, val))
+
+    def test_null_and_empty(self):
+        types = [casstype('UTF8Type'), casstype('AsciiType')]
+        reader = copyformats.JsonLinesReader(['{"c0": "", "c1": null}', '{}', '',
+                                              '{"c1": ""}'], ['c0', 'c1'], types, NULL)
+        self.assertEqual(list(reader), [['', NULL], [NULL, NULL], [NULL, '']])
+        self.assertEqual(reader.line_num, 4)
+
+    def test_bare_nonfinite(self):
+        # not JSON, but what some writers produce for these
+        types = [casstype('DoubleType'), casstype('ListType(%(m)sDoubleType)')]
+        reader = copyformats.JsonLinesReader(['{"c0": NaN, "c1": [Infinity, -Infinity, 1.5]}'],
+                                             ['c0', 'c1'], types, NULL)
+        self.assertEqual(list(reader), [['NaN', '[Infinity, -Infinity, 1.5]']])
+
+    def test_bad_lines(self):
+        types = [casstype('Int32Type'), casstype('ListType(%(m)sInt32Type)')]
+        for line in ('{"c0": 1', '[1, 2]', '{"c1": 3}', '{"c1": {"a": 1}}'):
+            reader = copyformats.JsonLinesReader([line], ['c0', 'c1'], types, NULL)
+            self.assertRaises(ValueError, list, reader)
@@ -0,0 +1,613 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import with_statement
+
+import csv
+import gzip
+import os
+import random
+import shutil
+import socket
+import tempfile
+import time
+from cStringIO import StringIO
+
+from .basecase import BaseTestCase, cql
+from cqlshlib import compressedio, copyutil
+from cqlshlib.copyformats import JsonLinesReader
+from cqlshlib.cql3handling import CqlTableDef
+
+MARSHAL = 'org.apache.cassandra.db.marshal.'
+
+def make_layout(columns, partition_key, clustering_key=()):
+    """
+    The layout of table ks.tbl, with the given (name, type name) columns.
+    """
+    layout = {u'keyspace_name': u'ks', u'columnfamily_name': u'tbl',
+              u'comparator': MARSHAL + 'CompositeType(%sUTF8Type)' % MARSHAL,
+              u'compaction_strategy_options': '{}', u'compression_parameters': '{}'}
+    coldefs = []
+    for name, typename in columns:
+        coltype, index = u'regular', None
+        if name in partition_key:
+            coltype, index = u'partition_key', partition_key.index(name)
+        elif name in clustering_key:
+            coltype, index = u'clustering_key', clustering_key.index(name)
+        coldefs.append({u'column_name': name, u'validator': MARSHAL + typename,
+                        u'type': coltype, u'component_index': index,
+                        u'index_name': None, u'index_type': None})
+    return CqlTableDef.from_layout(layout, coldefs)
+
+class FakeCursor(object):
+    """
+    Logs the queries it's given. Those containing 'FAIL' fail.
+    """
+
+    consistency_level = 'ONE'
+    supports_prepared_queries = False
+
+    def __init__(self):
+        self.queries = []
+
+    def execute(self, query, params={}, decoder=None, consistency_level=None):
+        if 'FAIL' in query:
+            raise cql.ProgrammingError('Bad Request: %s' % (query,))
+        self.queries.append(query)
+
+def batch_statements(query):
+    """
+    The statements in a query, whether it's a batch or not.
+    """
+    prefix, suffix = 'BEGIN UNLOGGED BATCH\n', ';\nAPPLY BATCH'
+    if not query.startswith(prefix):
+        return [query]
+    assert query.endswith(suffix)
+    return query[len(prefix):-len(suffix)].split(';\n')
+
+dialects = (
+    {},
+    {'escapechar': '\\'},
+    {'escapechar': '\\', 'doublequote': False},
+    {'quotechar': "'", 'delimiter': '|'},
+    {'delimiter': '\t', 'escapechar': '\\'},
+)
+
+# files the csv module has to make the best of
+malformed = (
+    'a,"b\nc\n',
+    'a,"b\nc',
+    'a,"b""\n',
+    'a,b\n"x',
+    '"a"b"c,d\ne\n',
+    'a\\\nb\n',
+    'a,"b\\"\nc"\nd\n',
+    '"\n\n\n',
+    '\n\n\n',
+)
+
+def random_csv(rand, dialect, numrecords):
+    """
+    Text in the given dialect with plenty of quoted fields, escapes and
+    newlines, not all of them in quoted fields.
+    """
+    quote = dialect.get('quotechar', '"')
+    delim = dialect.get('delimiter', ',')
+    pieces = ['a', 'bc', ' ', quote, delim, '\n', '\r\n', '\\', '"', "'", '|', '\t']
+    lines = []
+    for n in xrange(numrecords):
+        fields = []
+        for f in xrange(rand.randint(1, 4)):
+            val = ''.join(rand.choice(pieces) for c in xrange(rand.randint(0, 6)))
+            if rand.random() < 0.5:
+                val = quote + val.replace(quote, quote * 2) + quote
+            fields.append(val)
+        lines.append(delim.join(fields) + rand.choice(('\n', '\n', '\r\n')))
+    return ''.join(lines)
+
+class TestMappedCsvFile(BaseTestCase):
+    def mapped(self, data, make_reader, dialect_options=None, skip_blank_lines=False):
+        f = tempfile.TemporaryFile()
+        self.addCleanup(f.close)
+        f.write(data)
+        f.flush()
+        mapped = copyutil.MappedCsvFile(f, make_reader, dialect_options, skip_blank_lines)
+        self.addCleanup(mapped.close)
+        return mapped
+
+    def read_plainly(self, data, make_reader, start_line=0):
+        try:
+            return [r for chunk in copyutil.read_chunks(make_reader(StringIO(data)), 1,
+                                                        first_line=start_line)
+                    for r in chunk]
+        except csv.Error:
+            return None
+
+    def read_chunked(self, mapped, chunksize, start=0):
+        records = []
+        last = None
+        try:
+            for chunk in mapped.chunks(chunksize, start):
+                # each chunk starts where the last one said it would end
+                if last is not None:
+                    self.assertEqual(chunk.first_rownum, last.first_rownum + last.numrecords)
+                    self.assertEqual(chunk.first_line, last.first_line + last.numlines)
+                records.extend(mapped.parse(chunk))
+                last = chunk
+        except csv.Error:
+            return None
+        return records
+
+    def check_same_records(self, data, make_reader, dialect_options=None,
+                           skip_blank_lines=False, chunksizes=(1, 2, 7, 100)):
+        expected = self.read_plainly(data, make_reader)
+        mapped = self.mapped(data, make_reader, dialect_options, skip_blank_lines)
+        for chunksize in chunksizes:
+            self.assertEqual(self.read_chunked(mapped, chunksize), expected,
+                             msg='%r read in chunks of %d' % (data, chunksize))
+
+    def test_chunks_match_csv_reader(self):
+        rand = random.Random(0)
+        for dialect in dialects:
+            make_reader = lambda lines: csv.reader(lines, **dialect)
+            for n in xrange(20):
+                data = random_csv(rand, dialect, rand.randint(1, 60))
+                self.check_same_records(data, make_reader, dialect)
+
+    def test_malformed_records(self):
+        for dialect in dialects:
+            make_reader = lambda lines: csv.reader(lines, **dialect)
+            for data in malformed:
+                self.check_same_records(data, make_reader, dialect)
+
+    def test_numrecords_follows_reader(self):
+        for dialect in dialects[:2]:
+            make_reader = lambda lines: csv.reader(lines, **dialect)
+            for data in malformed:
+                expected = self.read_plainly(data, make_reader)
+                chunk = self.mapped(data, make_reader, dialect).next_chunk(0, len(data))
+                self.assertEqual(chunk.numrecords, len(expected), msg=repr(data))
+
+    def test_first_chunk_is_header(self):
+        data = 'x,"y\nz"\n1,2\n3,4\n'
+        make_reader = csv.reader
+        mapped = self.mapped(data, make_reader, {})
+        header = mapped.next_chunk(0, 1)
+        self.assertEqual((header.end, header.numrecords, header.numlines), (8, 1, 2))
+        records = self.read_chunked(mapped, 1, header.end)
+        self.assertEqual([(r, line) for (r, line, row) in records], [(0, 1), (1, 2)])
+
+    def test_lines(self):
+        make_reader = lambda lines: csv.reader(lines, delimiter='\t', quoting=csv.QUOTE_NONE)
+        for data in ('a\tb\nc\n', 'a\n"b\n"\n', 'a\n\nb', '\n'):
+            self.check_same_records(data, make_reader)
+
+    def test_skip_blank_lines(self):
+        make_reader = lambda lines: JsonLinesReader(lines, ['a'], [cql.cqltypes.UTF8Type], 'null')
+        for data in ('{"a": "x"}\n\n{"a": "y"}\n', '\n \n\t\r\n{}\n', '{}\n  ', '{}\n\n{}',
+                     '{"a": "\\n"}\r\n\r\n'):
+            self.check_same_records(data, make_reader, skip_blank_lines=True)
+
+    def test_miscount_is_an_error(self):
+        data = '"a\nb"\nc\n'
+        mapped = self.mapped(data, csv.reader, {})
+        chunk = mapped.next_chunk(0, len(data))
+        self.assertEqual(chunk.numrecords, 2)
+        chunk.numrecords = 3
+        self.assertRaises(csv.Error, mapped.parse, chunk)
+
+class TestUnreachableAddresses(BaseTestCase):
+    def test_unreachable_addresses(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(5)
+        port = listener.getsockname()[1]
+        try:
+            # nothing listens on that port at 127.0.0.2, so it's refused
+            self.assertEqual(copyutil.unreachable_addresses(['127.0.0.1', '127.0.0.2'], port),
+                             set(['127.0.0.2']))
+        finally:
+            listener.close()
+
+class TestBatchInserter(BaseTestCase):
+    def setUp(self):
+        self.layout = make_layout([(u'k', 'Int32Type'), (u'c', 'Int32Type'),
+                                   (u'v', 'AsciiType')], [u'k'], [u'c'])
+        self.cursor = FakeCursor()
+
+    def make_inserter(self, batchsize, group_by_partition=False, maxerrors=0):
+        return copyutil.make_inserter(self.cursor, self.layout, [u'k', u'c', u'v'], '',
+                                      batchsize=batchsize, group_by_partition=group_by_partition,
+                                      maxerrors=maxerrors)
+
+    def records(self, rows):
+        return [(n, n + 1, row) for (n, row) in enumerate(rows)]
+
+    def test_batch_size(self):
+        rand = random.Random(0)
+        rows = [[str(rand.randint(0, 3)), str(n), 'x' * rand.choice((0, 5, 40, 400))]
+                for n in range(200)]
+        inserter = self.make_inserter(300)
+        self.assertEqual(inserter.import_records(self.records(rows)), (200, [], None))
+        batches = map(batch_statements, self.cursor.queries)
+        for batch, next_batch in zip(batches, batches[1:] + [None]):
+            # only a record too big for any batch goes over, on its own
+            if len(batch) > 1:
+                self.assertTrue(sum(map(len, batch)) <= 300, msg=batch)
+            # and each batch is as big as the next record lets it be
+            if next_batch is not None:
+                self.assertTrue(sum(map(len, batch)) + len(next_batch[0]) > 300, msg=batch)
+        self.assertTrue(any(len(batch[0]) > 300 for batch in batches))
+        self.assertEqual(sum(batches, []), map(inserter.make_query, rows))
+
+    def test_group_by_partition(self):
+        rows = [[str(n % 3), str(n), 'v'] for n in range(30)]
+        inserter = self.make_inserter(1000, group_by_partition=True)
+        self.assertEqual(inserter.import_records(self.records(rows)), (30, [], None))
+        statements = []
+        for query in self.cursor.queries:
+            batch = batch_statements(query)
+            keys = set(statement.split('VALUES (')[1].split(',')[0] for statement in batch)
+            self.assertEqual(len(keys), 1, msg=query)
+            statements.extend(batch)
+        self.assertEqual(sorted(statements), sorted(map(inserter.make_query, rows)))
+
+    def test_bad_record_flushes(self):
+        rows = [['1', '1', 'a'], ['2', '2', 'b'], ['3', '3'], ['4', '4', 'd']]
+        inserter = self.make_inserter(1000)
+        imported, rejects, error = inserter.import_records(self.records(rows))
+        self.assertEqual(imported, 2)
+        self.assertEqual([(rownum, line_num) for (rownum, line_num, row, err) in rejects],
+                         [(2, 3)])
+        self.assertEqual(error[:2], (2, 3))
+        statements = sum(map(batch_statements, self.cursor.queries), [])
+        self.assertEqual(statements, map(inserter.make_query, rows[:2]))
+
+    def test_failed_batch(self):
+        # a batch which fails is sent again a record at a time, to find the
+        # one to blame
+        rows = [['1', '1', 'a'], ['2', '2', 'FAIL'], ['3', '3', 'c']]
+        inserter = self.make_inserter(1000, maxerrors=5)
+        imported, rejects, error = inserter.import_records(self.records(rows))
+        self.assertEqual((imported, error), (2, None))
+        self.assertEqual([row for (rownum, line_num, row, err) in rejects], [rows[1]])
+        self.assertEqual(self.cursor.queries, [inserter.make_query(rows[0]),
+                                               inserter.make_query(rows[2])])
+
+    def test_unknown_column(self):
+        for batchsize in (None, 1000):
+            try:
+                copyutil.make_inserter(self.cursor, self.layout, [u'k', u'nope'], '',
+                                       batchsize=batchsize)
+            except KeyError, e:
+                self.assertEqual(e.args[0], "column u'nope' not found")
+            else:
+                self.fail('no error for an unknown column')
+
+class FakeConnection(object):
+    def cursor(self):
+        return FakeCursor()
+
+    def close(self):
+        pass
+
+class TestImportPool(BaseTestCase):
+    def setUp(self):
+        self.layout = make_layout([(u'k', 'Int32Type'), (u'v', 'AsciiType')], [u'k'])
+        self.errors = []
+
+    def make_pool(self, numworkers, rejectlog, maxerrors):
+        # each worker would put up with any number of bad records, so it's
+        # the total across all of them that has to stop the import
+        make_inserter = lambda cursor: copyutil.make_inserter(cursor, self.layout, [u'k', u'v'],
+                                                              '', maxerrors=10 ** 6)
+        return copyutil.ImportPool(numworkers, FakeConnection, make_inserter, 'ONE',
+                                   self.errors.append, on_rejects=rejectlog.add,
+                                   maxerrors=maxerrors)
+
+    def test_maxerrors(self):
+        errfile = StringIO()
+        rejectlog = copyutil.RejectLog(errfile, {}, None)
+        pool = self.make_pool(3, rejectlog, 5)
+        # one bad record in each chunk of ten
+        rows = [[str(n), 'FAIL' if n % 10 == 3 else 'v'] for n in range(2000)]
+        records = [(n, n + 1, row) for (n, row) in enumerate(rows)]
+        fed = 0
+        for start in range(0, len(records), 10):
+            if not pool.feed(records[start:start + 10]):
+                break
+            fed += 1
+        imported = pool.finish()
+        self.assertTrue(pool.failed)
+        self.assertTrue(fed < 200)
+        self.assertEqual(len([msg for msg in self.errors if msg.startswith('Too many errors')]), 1)
+        # everything rejected went to the log, and only that
+        errfile.seek(0)
+        logged = list(csv.reader(errfile))
+        self.assertEqual(len(logged), rejectlog.numrejected)
+        self.assertEqual(rejectlog.numrejected, pool.numerrors)
+        self.assertTrue(pool.numerrors > 5)
+        for line_num, err, k, v in logged:
+            self.assertEqual(v, 'FAIL')
+            self.assertEqual(rows[int(line_num) - 1], [k, v])
+            self.assertTrue(err.startswith('Bad Request'), msg=err)
+        self.assertEqual(len(set(line_num for line_num, err, k, v in logged)), len(logged))
+        # every chunk that was written had just the one bad record
+        self.assertEqual(imported, 9 * pool.numerrors)
+
+    def test_within_maxerrors(self):
+        errfile = StringIO()
+        rejectlog = copyutil.RejectLog(errfile, {}, None)
+        pool = self.make_pool(2, rejectlog, 5)
+        rows = [[str(n), 'FAIL' if n in (7, 15, 33, 90, 91) else 'v'] for n in range(100)]
+        records = [(n, n + 1, row) for (n, row) in enumerate(rows)]
+        for start in range(0, len(records), 10):
+            self.assertTrue(pool.feed(records[start:start + 10]))
+        self.assertEqual(pool.finish(), 95)
+        self.assertFalse(pool.failed)
+        self.assertEqual(self.errors, [])
+        errfile.seek(0)
+        self.assertEqual(sorted(int(line_num) - 1 for line_num, err, k, v in csv.reader(errfile)),
+                         [7, 15, 33, 90, 91])
+
+class TestRollingOutput(BaseTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.opened = []
+
+    def make_output(self, fname, compression=None, **kwargs):
+        # named as COPY TO names them
+        base, ext = compressedio.split_extension(os.path.join(self.tmpdir, fname), compression)
+
+        def open_shard(shard):
+            f = compressedio.open_output('%s.%04d%s' % (base, shard, ext), compression)
+            self.opened.append(f)
+            return f
+        return copyutil.RollingOutput(open_shard, **kwargs)
+
+    def contents(self, compression=None):
+        names = sorted(os.listdir(self.tmpdir))
+        read = gzip.open if compression == 'gzip' else open
+        return names, [read(os.path.join(self.tmpdir, name), 'rb').read() for name in names]
+
+    def test_maxsize(self):
+        rows = ['row%02d\n' % n for n in range(10)] + ['x' * 30 + '\n', 'last\n']
+        output = self.make_output('out.csv', maxsize=14, header='h\n')
+        for row in rows:
+            output.write(row)
+        output.close()
+        names, texts = self.contents()
+        self.assertEqual(names, ['out.csv.%04d' % n for n in range(1, 8)])
+        for text in texts:
+            self.assertTrue(text.startswith('h\n'))
+            # the one row too big for any file gets one to itself
+            self.assertTrue(len(text) <= 14 or text.count('\n') == 2, msg=text)
+        self.assertEqual(''.join(text[2:] for text in texts), ''.join(rows))
+        self.assertTrue(all(getattr(f, 'raw', f).closed for f in self.opened))
+
+    def test_maxrows(self):
+        rows = ['%d,a\n' % n for n in range(7)]
+        text = ''.join(rows)
+        row_ends = [len(''.join(rows[:n + 1])) for n in range(len(rows))]
+        output = self.make_output('out.csv.gz', 'gzip', maxrows=3)
+        output.write(text[:row_ends[1]], row_ends[:2])
+        output.write(text[row_ends[1]:], [end - row_ends[1] for end in row_ends[2:]])
+        self.assertEqual(output.position(), (3, 1, len(rows[6])))
+        output.close()
+        names, texts = self.contents('gzip')
+        self.assertEqual(names, ['out.csv.0001.gz', 'out.csv.0002.gz', 'out.csv.0003.gz'])
+        self.assertEqual(texts, [''.join(rows[0:3]), ''.join(rows[3:6]), rows[6]])
+        self.assertTrue(all(getattr(f, 'raw', f).closed for f in self.opened))
+
+    def test_resume(self):
+        output = self.make_output('out.csv', maxrows=2, header='h\n')
+        output.write('1\n')
+        shard, rows, size = output.position()
+        output.close()
+        f = open(os.path.join(self.tmpdir, 'out.csv.0001'), 'ab')
+        output = self.make_output('out.csv', maxrows=2, header='h\n', shard=shard, rows=rows,
+                                  size=size, f=f)
+        for row in ('2\n', '3\n'):
+            output.write(row)
+        output.close()
+        self.assertTrue(f.closed)
+        self.assertEqual(self.contents(), (['out.csv.0001', 'out.csv.0002'],
+                                           ['h\n1\n2\n', 'h\n3\n']))
+
+class TestCheckpoint(BaseTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.fname = os.path.join(self.tmpdir, 'checkpoint')
+
+    def identity(self, **kwargs):
+        # as COPY FROM describes itself
+        identity = dict(copy='from', keyspace='ks', table='tbl', columns=[u'k', u'v'],
+                        file='/data/in.csv')
+        identity.update(kwargs)
+        return identity
+
+    def test_round_trip(self):
+        checkpoint = copyutil.Checkpoint(self.fname, self.identity())
+        self.assertFalse(checkpoint.load())
+        flushed = []
+        checkpoint.flush = lambda: flushed.append(True)
+        state = dict(offset=1234, line=20, rows=19, ranges=[[u'-5', u'10', 3, False]])
+        checkpoint.update(state)
+        self.assertEqual(flushed, [True])
+        self.assertFalse(os.path.exists(self.fname + '.tmp'))
+        loaded = copyutil.Checkpoint(self.fname, self.identity())
+        self.assertTrue(loaded.load())
+        self.assertEqual(loaded.state, state)
+        checkpoint.remove()
+        self.assertFalse(os.path.exists(self.fname))
+        checkpoint.remove()
+
+    def test_interval(self):
+        checkpoint = copyutil.Checkpoint(self.fname, self.identity())
+        checkpoint.interval = 3600
+        checkpoint.update(dict(offset=1))
+        checkpoint.update(dict(offset=2))
+        loaded = copyutil.Checkpoint(self.fname, self.identity())
+        loaded.load()
+        self.assertEqual(loaded.state, dict(offset=1))
+        checkpoint.update(dict(offset=3), force=True)
+        loaded.load()
+        self.assertEqual(loaded.state, dict(offset=3))
+
+    def test_different_copy(self):
+        copyutil.Checkpoint(self.fname, self.identity()).update(dict(offset=1))
+        for different in (dict(table='other'), dict(columns=[u'v', u'k']),
+                          dict(file='/data/other.csv'), dict(copy='to')):
+            checkpoint = copyutil.Checkpoint(self.fname, self.identity(**different))
+            self.assertRaises(ValueError, checkpoint.load)
+        for text in ('not json', '[1, 2]', '{"state": {}}'):
+            with open(self.fname, 'wb') as f:
+                f.write(text)
+            checkpoint = copyutil.Checkpoint(self.fname, self.identity())
+            self.assertRaises(ValueError, checkpoint.load)
+
+    def test_resume(self):
+        # stop a COPY FROM partway through, and pick it up from the
+        # checkpoint, as the shell does
+        fname = os.path.join(self.tmpdir, 'in.csv')
+        with open(fname, 'wb') as f:
+            f.write(''.join('%d,"line\n%d"\n' % (n, n) for n in range(50)))
+        expected = [r for chunk in copyutil.read_chunks(csv.reader(open(fname, 'rb')), 10)
+                    for r in chunk]
+        linesource = copyutil.OffsetLineSource(open(fname, 'rb'))
+        checkpoint = copyutil.Checkpoint(self.fname, self.identity(file=fname))
+        for n, records in enumerate(copyutil.read_chunks(csv.reader(linesource), 7)):
+            checkpoint.update(dict(offset=linesource.offset, line=records[-1][1],
+                                   rows=records[-1][0] + 1), force=True)
+            if n == 2:
+                break
+        linesource.close()
+
+        checkpoint = copyutil.Checkpoint(self.fname, self.identity(file=fname))
+        self.assertTrue(checkpoint.load())
+        state = checkpoint.state
+        self.assertEqual(state['rows'], 21)
+        f = open(fname, 'rb')
+        f.seek(state['offset'])
+        records = [r for chunk in copyutil.read_chunks(csv.reader(copyutil.OffsetLineSource(f)),
+                                                       10, state['rows'], state['line'])
+                   for r in chunk]
+        f.close()
+        self.assertEqual(records, expected[21:])
+        # and the same, from the mapped file several workers share
+        f = open(fname, 'rb')
+        mapped = copyutil.MappedCsvFile(f, csv.reader, {})
+        records = [r for chunk in mapped.chunks(4, state['offset'], state['rows'], state['line'])
+                   for r in mapped.parse(chunk)]
+        mapped.close()
+        f.close()
+        self.assertEqual(records, expected[21:])
+
+# text, and seconds since the epoch
+timestamp_samples = (
+    ('0', 0.0),
+    ('1381234567123', 1381234567.123),
+    ('-1500', -1.5),
+    ('2013-10-08', 1381190400.0),
+    ('2013-10-08 12:34', 1381235640.0),
+    ('2013-10-08T12:34:56', 1381235696.0),
+    ('2013-10-08 12:34:56.7', 1381235696.7),
+    ('2013-10-08 12:34:56.789Z', 1381235696.789),
+    ('2013-10-08 12:34:56.05+0000', 1381235696.05),
+    ('2013-10-08 12:34:56+0200', 1381228496.0),
+    ('2013-10-08 12:34:56-05:30', 1381255496.0),
+    ('2013-10-08T12:34:56.001 +01:00', 1381232096.001),
+    ('1969-12-31 23:59:59.5Z', -0.5),
+    ('2013-1-8 1:02', 1357606920.0),
+)
+
+bad_timestamps = ('', 'now', '2013-10-08 12', '2013-10-08 12:34:56.1234',
+                  '2013-10-08 12:34:56+02', '1.5', '2013/10/08', '13-10-08')
+
+# literal, brackets, and what it splits into
+collection_samples = (
+    ('[]', '[]', []),
+    ('[1, 2, 3]', '[]', ['1', '2', '3']),
+    ("['a', 'b,c', '']", '[]', ['a', 'b,c', '']),
+    ("['it''s', '[x]', '{y: z}']", '[]', ["it's", '[x]', '{y: z}']),
+    ("  [ 'a' ,'b'  ]  ", '[]', ['a', 'b']),
+    ("{'x', 'y'}", '{}', ['x', 'y']),
+    ('{1.5, -2e3}', '{}', ['1.5', '-2e3']),
+    ("{'a': 1, 'b:c': 2}", '{}', [('a', '1'), ('b:c', '2')]),
+    ("{1: 'x, y', 2: ''}", '{}', [('1', 'x, y'), ('2', '')]),
+    ('{}', '{}', []),
+    ("['2013-10-08 12:34:56+0000']", '[]', ['2013-10-08 12:34:56+0000']),
+)
+
+# literal, brackets, and whether it's meant to be a map
+bad_collections = (
+    ('', '[]', False), ('[', '[]', False), ('[1, 2', '[]', False), ('[1,, 2]', '[]', False),
+    ('[1] x', '[]', False), ("['unclosed]", '[]', False), ('{1, 2}', '[]', False),
+    ('[1, 2]', '{}', False), ('[[1], [2]]', '[]', False), ('[1 2]', '[]', False),
+    ('{1: }', '{}', True), ('{1}', '{}', True), ('{1: 2, 3}', '{}', True),
+    ('{1: 2: 3}', '{}', True), ('{1, 2}', '{}', True),
+)
+
+class TestCsvParsing(BaseTestCase):
+    def setUp(self):
+        self.saved_tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'UTC'
+        time.tzset()
+
+    def tearDown(self):
+        if self.saved_tz is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = self.saved_tz
+        time.tzset()
+
+    def test_convert_timestamp(self):
+        for text, seconds in timestamp_samples:
+            self.assertAlmostEqual(copyutil.convert_timestamp(text), seconds, places=6,
+                                   msg=text)
+        for text in bad_timestamps:
+            self.assertRaises(ValueError, copyutil.convert_timestamp, text)
+
+    def test_local_time(self):
+        # times with no zone are local
+        os.environ['TZ'] = 'EST+05EDT,M3.2.0,M11.1.0'
+        time.tzset()
+        self.assertEqual(copyutil.convert_timestamp('2013-01-08 12:00'), 1357664400.0)
+        self.assertEqual(copyutil.convert_timestamp('2013-07-08 12:00'), 1373299200.0)
+        self.assertEqual(copyutil.convert_timestamp('2013-07-08 12:00Z'), 1373284800.0)
+
+    def test_split_collection_literal(self):
+        for literal, brackets, items in collection_samples:
+            is_map = brackets == '{}' and bool(items) and isinstance(items[0], tuple)
+            self.assertEqual(copyutil.split_collection_literal(literal, brackets[0], brackets[1],
+                                                               is_map=is_map),
+                             items, msg=literal)
+        for literal, brackets, is_map in bad_collections:
+            self.assertRaises(ValueError, copyutil.split_collection_literal, literal,
+                              brackets[0], brackets[1], is_map=is_map)
+
+    def test_convert_collections(self):
+        for typename, literal, value in (
+                ('ListType(%(m)sInt32Type)', '[3, 1, 2]', [3, 1, 2]),
+                ('SetType(%(m)sUTF8Type)', "{'a, b', 'it''s'}", set([u'a, b', u"it's"])),
+                ('MapType(%(m)sAsciiType,%(m)sDateType)', "{'x]': '1970-01-01 00:00:01Z'}",
+                 {'x]': 1.0}),
+                ('MapType(%(m)sInt32Type,%(m)sBooleanType)', '{1: true, 2: False}',
+                 {1: True, 2: False})):
+            cqltype = cql.cqltypes.lookup_casstype(MARSHAL + typename % {'m': MARSHAL})
+            self.assertEqual(copyutil.compile_converter(cqltype)(literal), value, msg=literal)
@@ -18,6 +18,39 @@
 # for Thrift connections, and $CQL_TEST_PORT to the associated port.
 
 from .basecase import BaseTestCase, cqlsh
+from cqlshlib.cql3handling import CqlRuleSet
+
+# statements, some of them cut short or wrong, for the parser
+parse_samples = (
+    "SELECT * FROM ks.tbl WHERE a = 1 AND b IN (1, 2) ORDER BY b DESC LIMIT 10;",
+    "SELECT a, writetime(b), ttl(c) FROM tbl WHERE a = 1;",
+    "SELECT COUNT(*) FROM \"Quoted\".tbl;",
+    "INSERT INTO ks.tbl (a, b, c) VALUES (1, 'x', {1: 'y'}) USING TTL 10 AND TIMESTAMP 5;",
+    "UPDATE tbl USING TTL 5 SET n = n + 1, d['k'] = 3 WHERE a = 1;",
+    "DELETE b, c['k'] FROM tbl USING TIMESTAMP 9 WHERE a IN (1, 2);",
+    "BEGIN UNLOGGED BATCH USING TIMESTAMP 3 INSERT INTO tbl (a, b) VALUES (1, 2); "
+    "UPDATE tbl SET n = n - 2 WHERE a = 1; DELETE b FROM tbl WHERE a = 3; APPLY BATCH;",
+    "BEGIN COUNTER BATCH UPDATE tbl SET n = n + 1 WHERE a = 1; APPLY BATCH;",
+    "CREATE KEYSPACE ks WITH replication = {'class': 'SimpleStrategy', "
+    "'replication_factor': 1} AND durable_writes = false;",
+    "CREATE TABLE ks.tbl (a int, b text, c map<int, text>, PRIMARY KEY ((a, b), c)) "
+    "WITH CLUSTERING ORDER BY (c DESC) AND COMPACT STORAGE AND comment = 'x';",
+    "CREATE INDEX idx ON tbl (b);",
+    "ALTER TABLE tbl ADD d list<uuid>;",
+    "ALTER TABLE tbl WITH gc_grace_seconds = 0 AND caching = 'all';",
+    "ALTER KEYSPACE ks WITH durable_writes = true;",
+    "DROP TABLE ks.tbl;",
+    "DROP INDEX idx;",
+    "TRUNCATE tbl;",
+    "USE \"Ks\";",
+    "GRANT SELECT ON KEYSPACE ks TO someone;",
+    "LIST ALL PERMISSIONS OF someone NORECURSIVE;",
+    "CREATE USER someone WITH PASSWORD 'p' SUPERUSER;",
+    "SELECT * FROM tbl WHERE a = ",
+    "INSERT INTO tbl (a, b) VALUES (1, 2) USING",
+    "BEGIN BATCH INSERT INTO tbl (a, b) VALUES (1, 2); UPDATE",
+    "bogus text that matches nothing;",
+)
 
 class TestCqlParsing(BaseTestCase):
     def setUp(self):
@@ -85,3 +118,24 @@ class TestCqlParsing(BaseTestCase):
 
     def test_parse_drop_index(self):
         pass
+
+    def test_contexts_share_tokens(self):
+        for text in parse_samples:
+            tokens = CqlRuleSet.cql_massage_tokens(CqlRuleSet.lex(text))
+            ctxts = CqlRuleSet.parse('Start', tokens, init_bindings={'*SRC*': text})
+            self.assertEqual(len(set(id(c.tokens) for c in ctxts)), min(len(ctxts), 1))
+            for c in ctxts:
+                self.assertEqual(c.matched + c.remainder, tuple(tokens), msg=text)
+                self.assertEqual(len(c.matched), c.offset, msg=text)
+                self.assertEqual(c.at_end(), not c.remainder, msg=text)
+
+    def test_whole_parse_of_long_batch(self):
+        batch = 'BEGIN BATCH\n%s\nAPPLY BATCH;' % '\n'.join(
+            ["INSERT INTO tbl (a, b) VALUES (%d, 'x');" % n,
+             "UPDATE tbl SET n = n + 1 WHERE a = %d;" % n,
+             "DELETE b FROM tbl WHERE a = %d;" % n][n % 3] for n in range(300))
+        tokens = CqlRuleSet.cql_massage_tokens(CqlRuleSet.lex(batch))
+        ctxt = CqlRuleSet.cql_whole_parse_tokens(tokens, srcstr=batch)
+        self.assertNotEqual(ctxt, None)
+        self.assertTrue(ctxt.at_end())
+        self.assertEqual(ctxt.get_binding('cfname'), 'tbl')
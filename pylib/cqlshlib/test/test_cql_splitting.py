@@ -0,0 +1,149 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+from .basecase import BaseTestCase, cqlsh
+from cqlshlib import cql3handling, util
+from cqlshlib.cqlhandling import StatementSplitter
+from cqlshlib.pylexotron import LexingError
+
+def make_ruleset():
+    """
+    The CQL 3 rules, with the shell's commands which end at a newline.
+    """
+    ruleset = cql3handling.Cql3ParsingRuleSet()
+    ruleset.append_rules(cql3handling.syntax_rules)
+    ruleset.commands_end_with_newline.update(cqlsh.my_commands_ending_with_newline)
+    return ruleset
+
+def split_all_at_once(ruleset, text):
+    """
+    Splitting as it was done before StatementSplitter: lex the whole text,
+    split it at each endtoken, and join up the statements in a batch.
+    Gives the LexingError's numbers instead, if there is one.
+    """
+    try:
+        tokens = ruleset.cql_massage_tokens(ruleset.lex(text))
+    except LexingError, e:
+        return ('error', e.linenum, e.charnum)
+    output = []
+    in_batch = False
+    for stmt in util.split_list(tokens, lambda t: t[0] == 'endtoken'):
+        if in_batch:
+            output[-1].extend(stmt)
+        else:
+            output.append(stmt)
+        if len(stmt) > 2:
+            if stmt[-3][0] == 'K_APPLY':
+                in_batch = False
+            elif stmt[0][0] == 'K_BEGIN':
+                in_batch = True
+    return output, in_batch
+
+split_samples = (
+    "SELECT * FROM t;\n",
+    "SELECT * FROM t; SELECT a\nFROM t;",
+    "INSERT INTO t (a, b) VALUES (1, 'two;\nlines');\n",
+    "INSERT INTO t (a, b) VALUES (1, 'unclosed;\n",
+    "INSERT INTO t (a, b) VALUES (1, 'it''s');\n",
+    'SELECT "quoted;\nname" FROM t;\n',
+    'SELECT "unclosed name;\nFROM t;\n',
+    "SELECT * FROM t; -- comment; with a semicolon\nSELECT 2;\n",
+    "SELECT * FROM t; // other comment;\n",
+    "SELECT /* a comment;\nover lines */ * FROM t;\n",
+    "SELECT * FROM t; /* unclosed comment;\n",
+    "BEGIN BATCH\nINSERT INTO t (a, b) VALUES (1, 2);\n"
+    "UPDATE t SET n = n + 1 WHERE a = 1;\nAPPLY BATCH;\n",
+    "BEGIN UNLOGGED BATCH INSERT INTO t (a, b) VALUES (1, 2); APPLY BATCH; SELECT 1;\n",
+    "BEGIN BATCH\nINSERT INTO t (a, b) VALUES (1, 2);\n",
+    "DESCRIBE TABLES\nSELECT 1;\n",
+    "help\nconsistency ONE\nshow version\n",
+    "USE ks;\n\n\n",
+    "SELECT `bad` FROM t;\n",
+    "SELECT 1;\nSELECT $;\n",
+    "",
+    "\n",
+    "SELECT 1;\r\nSELECT 2;\r\n",
+)
+
+# bits to make up more texts from at random
+split_pieces = (
+    "select * from t", ";", "\n", " ", "'abc", "'", '"na', '"', "me", "/* c", "*/",
+    "-- x\n", "// y", "BEGIN BATCH", "APPLY BATCH", "insert into t (a) values (1)",
+    "USE ks", "describe tables", "\n\n", "`", "\xc3\xa9", "BEGIN", " BATCH ", "x;y",
+    "''", "e\n", "\r\n",
+)
+
+class TestStatementSplitter(BaseTestCase):
+    def setUp(self):
+        self.ruleset = make_ruleset()
+
+    def texts(self):
+        rand = random.Random(0)
+        for text in split_samples:
+            yield text
+        for n in range(500):
+            yield ''.join(rand.choice(split_pieces) for _ in range(rand.randint(1, 12)))
+
+    def check_fed(self, text, cuts):
+        """
+        Feed text to a StatementSplitter in pieces, ending at each of cuts,
+        checking each time that it splits the text so far as it would be
+        split all at once.
+        """
+        splitter = StatementSplitter(self.ruleset)
+        prev = 0
+        for cut in cuts:
+            expected = split_all_at_once(self.ruleset, text[:cut])
+            try:
+                splitter.feed(text[prev:cut])
+            except LexingError, e:
+                self.assertEqual(('error', e.linenum, e.charnum), expected, msg=repr(text[:cut]))
+                return
+            prev = cut
+            self.assertEqual(splitter.split(), expected, msg=repr(text[:cut]))
+            statements, in_batch = expected
+            while statements and not statements[-1]:
+                statements.pop()
+            incomplete = bool(statements) and (in_batch or statements[-1][-1][0] != 'endtoken')
+            self.assertEqual(splitter.needs_more(), incomplete, msg=repr(text[:cut]))
+
+    def test_split_all_at_once(self):
+        for text in self.texts():
+            try:
+                result = self.ruleset.cql_split_statements(text)
+            except LexingError, e:
+                result = ('error', e.linenum, e.charnum)
+            self.assertEqual(result, split_all_at_once(self.ruleset, text), msg=repr(text))
+
+    def test_fed_by_line(self):
+        for text in self.texts():
+            cuts = []
+            for line in text.splitlines(True):
+                cuts.append((cuts[-1] if cuts else 0) + len(line))
+            self.check_fed(text, cuts or [0])
+
+    def test_fed_in_chunks(self):
+        rand = random.Random(1)
+        for text in self.texts():
+            for n in range(3):
+                cuts = sorted(rand.sample(xrange(len(text) + 1), min(len(text) + 1, 6)))
+                self.check_fed(text, cuts + [len(text)])
+
+    def test_fed_by_char(self):
+        for text in split_samples:
+            self.check_fed(text, range(len(text) + 1))
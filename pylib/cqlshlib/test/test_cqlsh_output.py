@@ -516,6 +516,43 @@ class TestCqlshOutput(BaseTestCase):
             """),
         ), cqlver=3)
 
+    def test_blob_limit_output(self):
+        self.assertCqlverQueriesGiveColoredOutput((
+            ("BLOBLIMIT 4", r"""
+            Now showing blobs up to 4 bytes.
+            nnnnnnnnnnnnnnnnnnnnnnnnnnnnnnnn
+            """),
+            ("select num, blobcol from has_all_types where num in (0, 1, 2, 3);", r"""
+             num | blobcol
+             MMM   MMMMMMM
+            -----+-------------------------
+
+               0 | 0x00010203... (9 bytes)
+               G   mmmmmmmmmmmmmmmmmmmmmmm
+               1 | 0xffffffff... (9 bytes)
+               G   mmmmmmmmmmmmmmmmmmmmmmm
+               2 |                      0x
+               G   mmmmmmmmmmmmmmmmmmmmmmm
+               3 |                    0x80
+               G   mmmmmmmmmmmmmmmmmmmmmmm
+
+
+            (4 rows)
+            nnnnnnnn
+            """),
+        ), cqlver=3)
+
+    def test_paged_expanded_output(self):
+        # rows keep counting up from one page to the next
+        output, result = testcall_cqlsh(prompt=None, tty=False, input='PAGING 2\nEXPAND ON\n'
+                                        'select num, blobcol from has_all_types '
+                                        'where num in (0, 1, 2, 3);\n')
+        lines = output.splitlines()
+        self.assertEqual([line for line in lines if line.startswith('@ Row')],
+                         ['@ Row 1', '@ Row 2', '@ Row 3', '@ Row 4'])
+        nums = [re.match(r'^ num\s*\| (\d+)', line) for line in lines]
+        self.assertEqual([m.group(1) for m in nums if m], ['0', '1', '2', '3'])
+
     def test_colname_decoding_errors(self):
         # not clear how to achieve this situation in the first place. the
         # validator works pretty well, and we can't change the comparator
@@ -0,0 +1,84 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+from uuid import UUID
+
+from .basecase import BaseTestCase, cql
+from cqlshlib.displaying import COLUMN_NAME_COLORS
+from cqlshlib.formatting import format_by_type, compile_formatter
+
+MARSHAL = 'org.apache.cassandra.db.marshal.'
+
+def casstype(name):
+    return cql.cqltypes.lookup_casstype(MARSHAL + name % {'m': MARSHAL})
+
+# types, and values of each to format
+format_samples = (
+    ('Int32Type', [0, -5, 123456, None, '']),
+    ('LongType', [2 ** 40, -1]),
+    ('IntegerType', [10 ** 30]),
+    ('CounterColumnType', [3]),
+    ('UTF8Type', [u'abc', u'a\\b', u'\x01x\xe9\u4e2d', u'', None]),
+    ('AsciiType', ['abc', 'a\\b\x02', 'x\x01\\', '']),
+    ('BytesType', ['\x00\xff', '\x00ab', '']),
+    ('DoubleType', [1.23456789, 1e300, -0.0, float('nan'), float('inf'), '']),
+    ('FloatType', [0.5]),
+    ('DecimalType', [Decimal('1.50'), Decimal('-1E+3')]),
+    ('DateType', [0.0, 1381234567.123, -86400.5, '']),
+    ('UUIDType', [UUID('0d7b7cf0-3a0a-11e3-aa6e-0800200c9a66')]),
+    ('TimeUUIDType', [UUID('0d7b7cf0-3a0a-11e3-aa6e-0800200c9a66')]),
+    ('BooleanType', [True, False]),
+    ('InetAddressType', ['127.0.0.1', '::1']),
+    ('ReversedType(%(m)sInt32Type)', [5]),
+    ('ListType(%(m)sUTF8Type)', [[u'a', u"b'\\"], [], [u'\x02\xe9']]),
+    ('ListType(%(m)sDateType)', [[0.0, 1e9]]),
+    ('SetType(%(m)sInt32Type)', [set([3, 1, 2])]),
+    ('SetType(%(m)sDoubleType)', [set([0.1, 2.5])]),
+    ('MapType(%(m)sUTF8Type,%(m)sDateType)', [{u'x': 0.0, u'a\n': 1e9}]),
+    ('MapType(%(m)sInt32Type,%(m)sBytesType)', [{1: '\x00', 2: ''}]),
+    ('MapType(%(m)sUUIDType,%(m)sBooleanType)', [{UUID(int=1): True}]),
+)
+
+format_settings = (
+    dict(),
+    dict(addcolor=True),
+    dict(addcolor=True, colormap=COLUMN_NAME_COLORS),
+    dict(nullval='NUL', time_format='%Y', float_precision=5),
+    dict(addcolor=True, nullval='NUL', time_format='%Y-%m-%d %H:%M:%S%z', float_precision=1),
+)
+
+class TestCompiledFormatters(BaseTestCase):
+    def test_same_as_format_by_type(self):
+        for typename, values in format_samples:
+            cqltype = casstype(typename)
+            for settings in format_settings:
+                formatter = compile_formatter(cqltype, 'utf8', **settings)
+                for val in values:
+                    expected = format_by_type(cqltype, val, 'utf8', **settings)
+                    got = formatter(val)
+                    msg = '%s %r %r' % (typename, val, settings)
+                    self.assertEqual(got.strval, expected.strval, msg=msg)
+                    self.assertEqual(got.displaywidth, expected.displaywidth, msg=msg)
+                    if settings.get('addcolor'):
+                        self.assertEqual(got.coloredval, expected.coloredval, msg=msg)
+
+    def test_blob_limit(self):
+        formatter = compile_formatter(casstype('BytesType'), 'utf8', blob_limit=2)
+        self.assertEqual(formatter('\x01\x02').strval, '0x0102')
+        self.assertEqual(formatter('\x01\x02\x03').strval, '0x0102... (3 bytes)')
+        formatter = compile_formatter(casstype('ListType(%(m)sBytesType)'), 'utf8', blob_limit=1)
+        self.assertEqual(formatter(['\x01\x02']).strval, '[0x01... (2 bytes)]')
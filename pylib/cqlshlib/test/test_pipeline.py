@@ -0,0 +1,150 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from .basecase import BaseTestCase
+from cqlshlib.pipeline import StatementPipeline
+
+class FakeCursor(object):
+    consistency_level = 'ONE'
+
+class FakeConnection(object):
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor()
+
+    def close(self):
+        self.closed = True
+
+class FakeServer(object):
+    """
+    Runs statements for a StatementPipeline. A statement 'wait <name>'
+    blocks until release(name); 'fail' reports an error, 'raise' raises
+    one; 'set <name>' releases name. Everything run is logged, with the
+    consistency level it was run at.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = {}
+        self.log = []
+        self.running = self.most_running = 0
+        self.connections = []
+
+    def event(self, name):
+        with self.lock:
+            return self.events.setdefault(name, threading.Event())
+
+    def release(self, name):
+        self.event(name).set()
+
+    def connect(self):
+        conn = FakeConnection(self)
+        with self.lock:
+            self.connections.append(conn)
+        return conn
+
+    def execute(self, cursor, statement, printerr):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        try:
+            words = statement.split()
+            if words[0] == 'wait':
+                self.event(words[1]).wait(10)
+            elif words[0] == 'set':
+                self.release(words[1])
+            elif words[0] == 'fail':
+                printerr('Bad Request: %s' % statement)
+                return False
+            elif words[0] == 'raise':
+                raise IOError('connection lost')
+            with self.lock:
+                self.log.append((statement, cursor.consistency_level))
+            return True
+        finally:
+            with self.lock:
+                self.running -= 1
+
+class TestStatementPipeline(BaseTestCase):
+    def setUp(self):
+        self.server = FakeServer()
+        self.reports = []
+
+    def make_pipeline(self, size):
+        return StatementPipeline(size, self.server.connect, self.server.execute,
+                                 lambda tag, errors: self.reports.append((tag, errors)))
+
+    def test_reports_in_order(self):
+        pipeline = self.make_pipeline(3)
+        pipeline.submit(1, 'wait a')
+        pipeline.submit(2, 'fail 2')
+        pipeline.submit(3, 'set a')
+        pipeline.submit(4, 'raise')
+        pipeline.close()
+        # the statements after the first finish ahead of it, but come back
+        # in the order they went in, each with its own line
+        self.assertEqual(self.reports, [(1, []), (2, ['Bad Request: fail 2']), (3, []),
+                                        (4, ['connection lost'])])
+        self.assertTrue(all(conn.closed for conn in self.server.connections))
+
+    def test_size(self):
+        pipeline = self.make_pipeline(2)
+        for n in range(10):
+            pipeline.submit(n, 'wait never' if n == 0 else 'x %d' % n)
+        self.server.release('never')
+        pipeline.close()
+        self.assertEqual([tag for tag, errors in self.reports], range(10))
+        self.assertTrue(self.server.most_running <= 2)
+        self.assertTrue(len(self.server.connections) <= 2)
+
+    def test_drain_waits(self):
+        # what the shell does before a statement that can't be pipelined
+        pipeline = self.make_pipeline(4)
+        pipeline.submit(1, 'wait a')
+        pipeline.submit(2, 'x 2')
+        timer = threading.Timer(0.2, self.server.release, ['a'])
+        timer.start()
+        started = time.time()
+        pipeline.drain()
+        self.assertTrue(time.time() - started >= 0.1)
+        self.assertEqual(sorted(self.server.log), [('wait a', 'ONE'), ('x 2', 'ONE')])
+        self.assertEqual(self.reports, [(1, []), (2, [])])
+        self.assertEqual(pipeline.inflight, 0)
+        pipeline.submit(3, 'x 3')
+        pipeline.close()
+        self.assertEqual(self.reports[-1], (3, []))
+        timer.join()
+
+    def test_use_and_consistency(self):
+        pipeline = self.make_pipeline(1)
+        pipeline.submit(1, 'x 1', use='USE ks1', consistency_level='QUORUM')
+        pipeline.submit(2, 'x 2', use='USE ks1')
+        pipeline.submit(3, 'x 3', use='fail USE ks2')
+        pipeline.submit(4, 'x 4', use='USE ks1')
+        pipeline.close()
+        # the USE is only repeated when it changes, and a statement whose
+        # USE fails isn't run
+        self.assertEqual([statement for statement, cl in self.server.log],
+                         ['USE ks1', 'x 1', 'x 2', 'USE ks1', 'x 4'])
+        self.assertEqual(self.server.log[1], ('x 1', 'QUORUM'))
+        self.assertEqual(self.reports, [(1, []), (2, []), (3, ['Bad Request: fail USE ks2']),
+                                        (4, [])])
@@ -0,0 +1,155 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .basecase import BaseTestCase, cql
+from cql.cassandra.ttypes import (InvalidRequestException, TimedOutException,
+                                  UnavailableException)
+from cql.thrifteries import ThriftCursor
+from cqlshlib import ratelimit
+
+class FakeTime(object):
+    """
+    A clock which only moves when something sleeps.
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def driver_error(exc):
+    """
+    What the cql driver raises when thrift gives it exc.
+    """
+    def executor():
+        raise exc
+    try:
+        ThriftCursor.handle_cql_execution_errors.im_func(None, executor)
+    except cql.Error, e:
+        return e
+
+class TestErrors(BaseTestCase):
+    def test_driver_messages(self):
+        unavailable = driver_error(UnavailableException())
+        timeout = driver_error(TimedOutException())
+        invalid = driver_error(InvalidRequestException(why='no such table'))
+        self.assertTrue(ratelimit.is_unavailable(unavailable))
+        self.assertFalse(ratelimit.is_timeout(unavailable))
+        self.assertTrue(ratelimit.is_timeout(timeout))
+        self.assertFalse(ratelimit.is_unavailable(timeout))
+        for err in (unavailable, timeout):
+            self.assertTrue(ratelimit.is_overloaded(err))
+        for err in (invalid, cql.OperationalError('something else'),
+                    ValueError(ratelimit.TIMED_OUT_MESSAGE)):
+            self.assertFalse(ratelimit.is_overloaded(err), msg=repr(err))
+
+class TestBackoff(BaseTestCase):
+    def test_growth_and_cap(self):
+        for trynum in range(2, 20):
+            expected = min(16.0, 0.5 * 2 ** (trynum - 2))
+            for n in range(50):
+                delay = ratelimit.backoff_delay(trynum)
+                self.assertTrue(expected * 0.5 <= delay <= expected, msg=(trynum, delay))
+        for n in range(50):
+            self.assertTrue(ratelimit.backoff_delay(100, base=1, maximum=3) <= 3)
+
+class TestTokenBucket(BaseTestCase):
+    def test_rate(self):
+        t = FakeTime()
+        bucket = ratelimit.TokenBucket(10, t.clock, t.sleep)
+        # a second's worth to start with
+        for n in range(10):
+            bucket.take()
+        self.assertEqual(t.sleeps, [])
+        for n in range(90):
+            bucket.take()
+        self.assertAlmostEqual(t.now - 1000.0, 9.0)
+        self.assertTrue(all(abs(s - 0.1) < 1e-9 for s in t.sleeps))
+
+    def test_idle(self):
+        t = FakeTime()
+        bucket = ratelimit.TokenBucket(10, t.clock, t.sleep)
+        t.now += 100
+        # no more than a second's worth builds up
+        bucket.take(25)
+        self.assertAlmostEqual(t.sleeps[-1], 1.5)
+        t.now += 0.5
+        bucket.take(5)
+        self.assertEqual(len(t.sleeps), 1)
+
+    def test_slow_rate(self):
+        t = FakeTime()
+        bucket = ratelimit.TokenBucket(0.5, t.clock, t.sleep)
+        bucket.take()
+        bucket.take()
+        self.assertAlmostEqual(t.now - 1000.0, 2.0)
+
+class TestThrottle(BaseTestCase):
+    def test_unlimited(self):
+        t = FakeTime()
+        throttle = ratelimit.Throttle(clock=t.clock, sleep=t.sleep)
+        for n in range(1000):
+            throttle.wait(5)
+            throttle.succeeded(5)
+        self.assertEqual(t.sleeps, [])
+
+    def test_maxrate(self):
+        t = FakeTime()
+        throttle = ratelimit.Throttle(100, t.clock, t.sleep)
+        for n in range(600):
+            throttle.wait()
+            throttle.succeeded()
+        self.assertAlmostEqual(t.now - 1000.0, 5.0)
+        self.assertEqual(throttle.bucket.rate, 100)
+
+    def test_overloaded(self):
+        t = FakeTime()
+        throttle = ratelimit.Throttle(clock=t.clock, sleep=t.sleep)
+        throttle.succeeded(400)
+        t.now += 10
+        # starts from the 40 rows a second managed so far, halved
+        throttle.overloaded(2)
+        self.assertEqual(throttle.bucket.rate, 20)
+        self.assertTrue(0.25 <= t.sleeps[-1] <= 0.5)
+        # only cut once a second
+        t.now = throttle.last_cut + 0.5
+        throttle.overloaded(3)
+        self.assertEqual(throttle.bucket.rate, 20)
+        self.assertTrue(0.5 <= t.sleeps[-1] <= 1.0)
+        t.now = throttle.last_cut + 1.0
+        throttle.overloaded(4)
+        self.assertEqual(throttle.bucket.rate, 10)
+        # and then back up by a twentieth of each row written
+        throttle.succeeded(40)
+        self.assertAlmostEqual(throttle.bucket.rate, 12)
+        for n in range(10):
+            t.now += 1
+            throttle.overloaded(2)
+        self.assertEqual(throttle.bucket.rate, throttle.min_rate)
+
+    def test_overloaded_under_maxrate(self):
+        t = FakeTime()
+        throttle = ratelimit.Throttle(50, t.clock, t.sleep)
+        throttle.overloaded(2)
+        self.assertEqual(throttle.bucket.rate, 25)
+        throttle.succeeded(1000)
+        self.assertEqual(throttle.bucket.rate, 50)
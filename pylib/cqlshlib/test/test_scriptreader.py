@@ -0,0 +1,141 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+from StringIO import StringIO
+
+from .basecase import BaseTestCase
+from .test_cql_splitting import make_ruleset
+from cqlshlib.cqlhandling import StatementSplitter
+from cqlshlib.pylexotron import LexingError
+from cqlshlib.scriptreader import ScriptReader
+
+script_pieces = (
+    "SELECT * FROM t;", "select\n*\nfrom t\n;", "INSERT INTO t (k) VALUES ('a\nb;c');",
+    "-- comment ;\n", "// c2\n", "/* multi\nline; */", "/* a */\n",
+    "BEGIN BATCH\nINSERT INTO t (k) VALUES (1);\n", "APPLY BATCH;", "USE ks;", "help\n",
+    "\n", "  ", "'unclosed\n", '"name\n;"', "SELECT `x;\n", "$$;\n", "DESCRIBE TABLES\n",
+    "select 1 from \"t\";", "BEGIN UNLOGGED BATCH update t set a=1;", ";", "\r\n",
+    "x;\r\n", "SELECT 1; -- done\n", "SELECT 2; /* a\n b */\n", "SELECT 3; /* c */ SELECT 4;\n",
+    "CONSISTENCY ONE\n",
+)
+
+def read_by_lines(ruleset, text):
+    """
+    What the shell's cmdloop() makes of a script, reading it a line at a
+    time: for each group of statements run together, (srcstr, statements,
+    number of the next line), or ('error', srcstr, linenum, charnum,
+    number of the next line) for a LexingError, and ('incomplete',) if
+    the script ends partway through a statement.
+    """
+    splitter = StatementSplitter(ruleset)
+    groups = []
+    srcstr = ''
+    lineno = 1
+    for line in StringIO(text):
+        srcstr += line
+        lineno += 1
+        try:
+            splitter.feed(line)
+        except LexingError, e:
+            groups.append(('error', srcstr, e.linenum, e.charnum, lineno))
+        else:
+            if splitter.needs_more():
+                continue
+            statements, in_batch = splitter.split()
+            while statements and not statements[-1]:
+                statements.pop()
+            if statements:
+                if in_batch or statements[-1][-1][0] != 'endtoken':
+                    continue
+                groups.append((srcstr, statements, lineno))
+        splitter.reset()
+        srcstr = ''
+    if srcstr.strip():
+        groups.append(('incomplete',))
+    return groups
+
+def read_in_blocks(ruleset, f, blocksize):
+    reader = ScriptReader(ruleset, f, blocksize=blocksize)
+    groups = []
+    while True:
+        try:
+            srcstr, statements = reader.next()
+        except StopIteration:
+            break
+        except LexingError, e:
+            groups.append(('error', reader.srcstr, e.linenum, e.charnum, reader.lineno))
+        else:
+            groups.append((srcstr, statements, reader.lineno))
+    if reader.incomplete:
+        groups.append(('incomplete',))
+    return groups
+
+class ShortReads(object):
+    """
+    A file giving back less than asked for from each read(), like a pipe.
+    """
+
+    def __init__(self, text, rand):
+        self.f = StringIO(text)
+        self.rand = rand
+
+    def read(self, size):
+        return self.f.read(min(size, self.rand.randint(1, 40)))
+
+class TestScriptReader(BaseTestCase):
+    blocksizes = (1, 2, 3, 7, 64, 65536)
+
+    def setUp(self):
+        self.ruleset = make_ruleset()
+
+    def texts(self):
+        rand = random.Random(0)
+        for n in range(300):
+            text = ''.join(rand.choice(script_pieces) for _ in range(rand.randint(1, 15)))
+            if rand.random() < 0.5 and not text.endswith('\n'):
+                text += '\n'
+            yield text
+
+    def test_same_as_by_lines(self):
+        for text in self.texts():
+            expected = read_by_lines(self.ruleset, text)
+            for blocksize in self.blocksizes:
+                self.assertEqual(read_in_blocks(self.ruleset, StringIO(text), blocksize),
+                                 expected, msg='%r in blocks of %d' % (text, blocksize))
+
+    def test_short_reads(self):
+        rand = random.Random(1)
+        for text in self.texts():
+            self.assertEqual(read_in_blocks(self.ruleset, ShortReads(text, rand), 64),
+                             read_by_lines(self.ruleset, text), msg=repr(text))
+
+    def test_readline(self):
+        # what a command like COPY FROM STDIN reads after its statement
+        text = "COPY t FROM STDIN;\n1,'a\nb'\n\\.\nSELECT 1;\nlast"
+        for blocksize in self.blocksizes:
+            reader = ScriptReader(self.ruleset, StringIO(text), blocksize=blocksize)
+            srcstr, statements = reader.next()
+            self.assertEqual(srcstr, "COPY t FROM STDIN;\n")
+            self.assertEqual(reader.lineno, 2)
+            self.assertEqual([reader.readline() for n in range(3)], ["1,'a\n", "b'\n", "\\.\n"])
+            self.assertEqual(reader.lineno, 5)
+            srcstr, statements = reader.next()
+            self.assertEqual(srcstr, "SELECT 1;\n")
+            self.assertEqual(reader.readline(), "last")
+            self.assertEqual(reader.readline(), "")
+            self.assertEqual(reader.lineno, 7)
+            self.assertRaises(StopIteration, reader.next)
@@ -0,0 +1,97 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import calendar
+import os
+import random
+import time
+
+from .basecase import BaseTestCase, unittest
+from cqlshlib import formatting
+
+# zones with DST changes of an hour, of half an hour (Lord Howe), at
+# offsets of a half hour from UTC (Kolkata, St. John's), and with none
+test_zones = ('America/New_York', 'Australia/Lord_Howe', 'Asia/Kolkata', 'Europe/London',
+              'America/St_Johns', 'UTC')
+
+test_time_formats = (
+    formatting.default_time_format,
+    '%d/%m/%Y %I %p %H:%M:%S%z',
+    '%Y %H:%M:%S',
+)
+
+def utc_offset(seconds):
+    return calendar.timegm(time.localtime(seconds)) - int(seconds)
+
+def offset_changes(year):
+    """
+    The times in the given year at which the local UTC offset changes.
+    """
+    changes = []
+    start = calendar.timegm((year, 1, 1, 0, 0, 0))
+    for day in range(366):
+        lo, hi = start + day * 86400, start + (day + 1) * 86400
+        if utc_offset(lo) == utc_offset(hi):
+            continue
+        offset = utc_offset(lo)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if utc_offset(mid) == offset:
+                lo = mid
+            else:
+                hi = mid
+        changes.append(hi)
+    return changes
+
+class TestTimestampFormatter(BaseTestCase):
+    def setUp(self):
+        self.saved_tz = os.environ.get('TZ')
+
+    def tearDown(self):
+        if self.saved_tz is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = self.saved_tz
+        time.tzset()
+
+    def sample_times(self, rand):
+        times = [rand.uniform(-2e9, 4e9) for _ in range(2000)]
+        times += [0.0, -0.5, -1.0, -1.5, -3599.75, -3600.25, 1e9 + 0.999, 0.001]
+        for year in (1942, 1950, 1969, 1985, 2007, 2013, 2024):
+            for change in offset_changes(year):
+                # either side of the change, and the hours it moves between
+                for delta in range(-3 * 3600, 3 * 3600, 877):
+                    times.append(change + delta + rand.random())
+                times += [change - 1, change - 0.5, change, change + 0.5, change + 1]
+        return times
+
+    def check_zone(self, zone):
+        if not os.path.exists(os.path.join('/usr/share/zoneinfo', zone)) and zone != 'UTC':
+            return
+        os.environ['TZ'] = zone
+        time.tzset()
+        rand = random.Random(zone)
+        times = self.sample_times(rand)
+        for time_format in test_time_formats:
+            formatter = formatting.TimestampFormatter(time_format)
+            for seconds in times:
+                self.assertEqual(formatter(seconds), formatting.strftime(time_format, seconds),
+                                 msg='%s %r %r' % (zone, time_format, seconds))
+
+    @unittest.skipUnless(hasattr(time, 'tzset'), 'needs time.tzset()')
+    def test_same_as_strftime(self):
+        for zone in test_zones:
+            self.check_zone(zone)
@@ -0,0 +1,86 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import binascii
+import struct
+
+from .basecase import BaseTestCase
+from cqlshlib import tokenmap
+
+MURMUR3 = 'org.apache.cassandra.dht.Murmur3Partitioner'
+RANDOM = 'org.apache.cassandra.dht.RandomPartitioner'
+
+class FakeTokenRange(object):
+    def __init__(self, end_token, endpoints, rpc_endpoints=None):
+        self.start_token = None
+        self.end_token = end_token
+        self.endpoints = endpoints
+        self.rpc_endpoints = rpc_endpoints
+
+class TestTokens(BaseTestCase):
+    def test_murmur3(self):
+        # tokens Cassandra gives these keys
+        for key, token in (('123', -7468325962851647638),
+                           ('\x00\xff\x10\xfa\x99' * 10, 5837342703291459765),
+                           ('\xfe' * 8, -8927430733708461935),
+                           ('\x10' * 8, 1446172840243228796),
+                           (str(2 ** 63 - 1), 7162290910810015547),
+                           ('', 0)):
+            self.assertEqual(tokenmap.murmur3_token(key), token, msg=repr(key))
+
+    def test_murmur3_lengths(self):
+        # every tail length, with and without full blocks before it
+        for length in range(40):
+            token = tokenmap.murmur3_token('\x9c' * length)
+            self.assertTrue(-2 ** 63 < token < 2 ** 63, msg=length)
+
+    def test_random(self):
+        # md5('a') = 0cc175b9..., positive as a signed integer
+        digest = tokenmap.md5('a').digest()
+        self.assertEqual(tokenmap.random_token('a'), long(binascii.hexlify(digest), 16))
+        # md5('b') = 92eb5ffe..., negative, so made positive
+        digest = tokenmap.md5('b').digest()
+        self.assertEqual(tokenmap.random_token('b'),
+                         2 ** 128 - long(binascii.hexlify(digest), 16))
+        for key in ('', '123', '\xff' * 20):
+            self.assertTrue(0 <= tokenmap.random_token(key) <= 2 ** 127, msg=repr(key))
+
+    def test_composite_key(self):
+        self.assertEqual(tokenmap.composite_key(['a', 'bc']), '\x00\x01a\x00\x00\x02bc\x00')
+        self.assertEqual(tokenmap.composite_key(['', 'x' * 300]),
+                         '\x00\x00\x00' + struct.pack('>H', 300) + 'x' * 300 + '\x00')
+
+class TestTokenMap(BaseTestCase):
+    def test_replicas_for_token(self):
+        ring = [FakeTokenRange('100', ['10.0.0.2']),
+                FakeTokenRange('-100', ['10.0.0.1']),
+                FakeTokenRange('5000', ['10.0.0.3'])]
+        tmap = tokenmap.TokenMap(MURMUR3, ring)
+        for token, address in ((-2 ** 63, '10.0.0.1'), (-100, '10.0.0.1'), (-99, '10.0.0.2'),
+                               (100, '10.0.0.2'), (101, '10.0.0.3'), (5000, '10.0.0.3'),
+                               (5001, '10.0.0.1'), (2 ** 63 - 1, '10.0.0.1')):
+            self.assertEqual(tmap.replicas_for_token(token), [address], msg=token)
+        self.assertEqual(tmap.replicas_for_key('123'), ['10.0.0.1'])
+
+    def test_rpc_addresses(self):
+        ring = [FakeTokenRange('0', ['10.0.0.1', '10.0.0.2'], ['0.0.0.0', '192.168.0.2'])]
+        tmap = tokenmap.TokenMap(RANDOM, ring)
+        self.assertEqual(tmap.replicas_for_key('a'), ['10.0.0.1', '192.168.0.2'])
+
+    def test_supports(self):
+        self.assertTrue(tokenmap.TokenMap.supports(MURMUR3))
+        self.assertTrue(tokenmap.TokenMap.supports(RANDOM))
+        self.assertFalse(tokenmap.TokenMap.supports('org.apache.cassandra.dht.LocalPartitioner'))
@@ -0,0 +1,81 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+from .basecase import BaseTestCase
+from cqlshlib import wcwidth
+
+width_samples = (
+    u'',
+    u'plain ascii',
+    u'caf\xe9 \xa0\xff',                      # Latin-1, with a no-break space
+    u'e\u0301 a\u0300\u0323',                 # combining marks
+    u'\u4e2d\u6587 and \uac00',               # CJK and Hangul
+    u'\uff30\uffe1',                          # fullwidth forms
+    u'\xa7\xb1 \u2460 \u03b1',                # ambiguous width, for the CJK variant
+    u'\U0001f600 \U00020000 \U0002fffd',      # astral
+    u'\U000e0001\U000f0000',
+    u'tab\there',                             # controls give -1
+    u'\x00nul',
+    u'bell\x07',
+    u'\x7f',
+    u'\x85next line',
+    u'ok \u4e2d\x1b[0m',
+)
+
+def original_wcswidth(s):
+    return wcwidth.mk_wcswidth(map(ord, s))
+
+def original_wcswidth_cjk(s):
+    return wcwidth.mk_wcswidth_cjk(map(ord, s))
+
+class TestWidthCalculator(BaseTestCase):
+    def check(self, s):
+        self.assertEqual(wcwidth.wcswidth(s), original_wcswidth(s), msg=repr(s))
+        self.assertEqual(wcwidth.wcswidth_cjk(s), original_wcswidth_cjk(s), msg=repr(s))
+        for c in s:
+            self.assertEqual(wcwidth.wcwidth(c), wcwidth.mk_wcwidth(ord(c)), msg=repr(c))
+            self.assertEqual(wcwidth.wcwidth_cjk(c), wcwidth.mk_wcwidth_cjk(ord(c)), msg=repr(c))
+
+    def test_samples(self):
+        for s in width_samples:
+            self.check(s)
+        self.assertEqual(wcwidth.wcswidth(u'tab\there'), -1)
+        self.assertEqual(wcwidth.wcswidth(u'\x85next line'), -1)
+        # a second time, from the memo
+        for s in width_samples:
+            self.check(s)
+
+    def test_whole_bmp(self):
+        for ucs in xrange(0, 0x10000, 7):
+            c = unichr(ucs)
+            self.assertEqual(wcwidth.wcwidth(c), wcwidth.mk_wcwidth(ucs), msg=hex(ucs))
+            self.assertEqual(wcwidth.wcwidth_cjk(c), wcwidth.mk_wcwidth_cjk(ucs), msg=hex(ucs))
+
+    def test_past_memo_size(self):
+        rand = random.Random(0)
+        alphabet = u''.join(width_samples)
+        strings = [u''.join(rand.choice(alphabet) for _ in range(rand.randint(1, 6)))
+                   for n in range(wcwidth.WIDTH_MEMO_SIZE // 2)]
+        # more different strings than the memo holds, then all over again
+        # once it has been cleared
+        for n in range(3):
+            for i, s in enumerate(strings):
+                s += unichr(0x4e00 + i % 100) * n
+                self.assertEqual(wcwidth.wcswidth(s), original_wcswidth(s), msg=repr(s))
+                self.assertEqual(wcwidth.wcswidth_cjk(s), original_wcswidth_cjk(s), msg=repr(s))
+        self.assertTrue(len(wcwidth._widths.memo) <= wcwidth.WIDTH_MEMO_SIZE)
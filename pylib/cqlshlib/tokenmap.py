@@ -0,0 +1,174 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Working out which nodes hold a partition key, the way Cassandra does, so
+that writes can be sent straight to one of its replicas instead of to a
+coordinator which would have to forward them.
+"""
+
+import binascii
+import struct
+from bisect import bisect_left
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+
+MASK64 = 0xffffffffffffffff
+MURMUR3_C1 = 0x87c37b91114253d5
+MURMUR3_C2 = 0x4cf5ad432745937f
+
+def rotl64(x, r):
+    return ((x << r) | (x >> (64 - r))) & MASK64
+
+def fmix64(k):
+    k ^= k >> 33
+    k = (k * 0xff51afd7ed558ccd) & MASK64
+    k ^= k >> 33
+    k = (k * 0xc4ceb9fe1a85ec53) & MASK64
+    k ^= k >> 33
+    return k
+
+def signed_byte(c):
+    b = ord(c)
+    if b > 127:
+        b -= 256
+    return b
+
+def murmur3_token(key):
+    """
+    The Murmur3Partitioner token for a serialized partition key: the first
+    half of MurmurHash3_x64_128 with a seed of 0, as Cassandra computes it.
+    That differs from the reference hash in one way: the bytes of the tail
+    are sign-extended before being shifted into place, since that's what
+    Java bytes do. Long.MIN_VALUE is the partitioner's minimum token, so a
+    key hashing to that gets Long.MAX_VALUE instead.
+    """
+    length = len(key)
+    nblocks = length // 16
+    h1 = h2 = 0
+    for offset in range(0, nblocks * 16, 16):
+        k1, k2 = struct.unpack_from('<QQ', key, offset)
+        k1 = rotl64((k1 * MURMUR3_C1) & MASK64, 31)
+        h1 ^= (k1 * MURMUR3_C2) & MASK64
+        h1 = rotl64(h1, 27)
+        h1 = (((h1 + h2) & MASK64) * 5 + 0x52dce729) & MASK64
+        k2 = rotl64((k2 * MURMUR3_C2) & MASK64, 33)
+        h2 ^= (k2 * MURMUR3_C1) & MASK64
+        h2 = rotl64(h2, 31)
+        h2 = (((h2 + h1) & MASK64) * 5 + 0x38495ab5) & MASK64
+
+    tail = key[nblocks * 16:]
+    k1 = k2 = 0
+    for n in range(len(tail) - 1, 7, -1):
+        k2 ^= (signed_byte(tail[n]) << ((n - 8) * 8)) & MASK64
+    if len(tail) > 8:
+        k2 = rotl64((k2 * MURMUR3_C2) & MASK64, 33)
+        h2 ^= (k2 * MURMUR3_C1) & MASK64
+    for n in range(min(len(tail), 8) - 1, -1, -1):
+        k1 ^= (signed_byte(tail[n]) << (n * 8)) & MASK64
+    if tail:
+        k1 = rotl64((k1 * MURMUR3_C1) & MASK64, 31)
+        h1 ^= (k1 * MURMUR3_C2) & MASK64
+
+    h1 ^= length
+    h2 ^= length
+    h1 = (h1 + h2) & MASK64
+    h2 = (h2 + h1) & MASK64
+    h1 = fmix64(h1)
+    h2 = fmix64(h2)
+    h1 = (h1 + h2) & MASK64
+
+    if h1 >= 2 ** 63:
+        h1 -= 2 ** 64
+    if h1 == -2 ** 63:
+        return 2 ** 63 - 1
+    return h1
+
+def random_token(key):
+    """
+    The RandomPartitioner token for a serialized partition key: the MD5
+    digest read as a signed big-endian integer, like Java's BigInteger
+    does, made positive.
+    """
+    token = long(binascii.hexlify(md5(key).digest()), 16)
+    if token >= 2 ** 127:
+        token -= 2 ** 128
+    return abs(token)
+
+def byte_ordered_token(key):
+    # describe_ring gives these tokens in hex, which sorts like the bytes do
+    return binascii.hexlify(key)
+
+def order_preserving_token(key):
+    return key.decode('utf8')
+
+# partitioner: (function giving the token for a serialized partition key,
+#               function turning a token from describe_ring into one
+#               comparable with those)
+partitioner_tokens = {
+    'org.apache.cassandra.dht.Murmur3Partitioner': (murmur3_token, long),
+    'org.apache.cassandra.dht.RandomPartitioner': (random_token, long),
+    'org.apache.cassandra.dht.ByteOrderedPartitioner': (byte_ordered_token, str),
+    'org.apache.cassandra.dht.OrderPreservingPartitioner': (order_preserving_token,
+                                                            order_preserving_token),
+}
+
+def composite_key(parts):
+    """
+    Serialize a partition key made of several columns, from the serialized
+    values of each, the way CompositeType does.
+    """
+    return ''.join([struct.pack('>H', len(part)) + part + '\x00' for part in parts])
+
+def replica_addresses(tokenrange):
+    """
+    The addresses clients should use for the replicas of a TokenRange from
+    describe_ring. Nodes listening for clients on all interfaces report
+    their rpc address as 0.0.0.0, so their gossip address is used then.
+    """
+    rpc_endpoints = tokenrange.rpc_endpoints or tokenrange.endpoints
+    return [rpc if rpc != '0.0.0.0' else ep
+            for (rpc, ep) in zip(rpc_endpoints, tokenrange.endpoints)]
+
+class TokenMap(object):
+    """
+    Maps serialized partition keys to the addresses of their replicas,
+    from a ring as given by describe_ring, for the given partitioner.
+    Each TokenRange covers the tokens from its start (exclusive) to its
+    end (inclusive), the last one wrapping around to the first.
+    """
+
+    def __init__(self, partitioner, ring):
+        self.tokenize, parse_token = partitioner_tokens[partitioner]
+        ranges = sorted((parse_token(tr.end_token), replica_addresses(tr)) for tr in ring)
+        self.ends = [end for (end, _) in ranges]
+        self.replicas = [replicas for (_, replicas) in ranges]
+
+    @staticmethod
+    def supports(partitioner):
+        return partitioner in partitioner_tokens
+
+    def replicas_for_token(self, token):
+        n = bisect_left(self.ends, token)
+        if n == len(self.ends):
+            n = 0
+        return self.replicas[n]
+
+    def replicas_for_key(self, key):
+        return self.replicas_for_token(self.tokenize(key))
@@ -76,6 +76,9 @@
 #
 # Latest C version: http://www.cl.cam.ac.uk/~mgk25/ucs/wcwidth.c
 
+import re
+from array import array
+
 # auxiliary function for binary search in interval table
 def bisearch(ucs, table):
   min = 0
@@ -300,18 +303,64 @@ def mk_wcswidth_cjk(pwcs):
 
   return width
 
-# python-y versions, dealing with unicode objects
-def wcwidth(c):
-    return mk_wcwidth(ord(c))
-
-def wcswidth(s):
-    return mk_wcswidth(map(ord, s))
-
-def wcwidth_cjk(c):
-    return mk_wcwidth_cjk(ord(c))
-
-def wcswidth_cjk(s):
-    return mk_wcswidth_cjk(map(ord, s))
+# python-y versions, dealing with unicode objects.
+#
+# These get called for every text value cqlsh prints, so they avoid
+# mk_wcwidth() where they can. Strings of printable ISO 8859-1 characters
+# (just ASCII, for the CJK widths, since the ambiguous table covers some
+# of the rest) are one column per character. Other widths in the Basic
+# Multilingual Plane come from a table built on first use, and widths of
+# whole strings are remembered, up to WIDTH_MEMO_SIZE of them at a time.
+
+WIDTH_MEMO_SIZE = 10000
+
+class WidthCalculator(object):
+    def __init__(self, char_width, single_width_re):
+        self.char_width = char_width
+        self.is_single_width = re.compile(single_width_re).match
+        self.bmp_widths = None
+        self.memo = {}
+
+    def table(self):
+        if self.bmp_widths is None:
+            self.bmp_widths = array('b', map(self.char_width, xrange(0x10000)))
+        return self.bmp_widths
+
+    def width(self, c):
+        ucs = ord(c)
+        if ucs < 0x10000:
+            return self.table()[ucs]
+        return self.char_width(ucs)
+
+    def string_width(self, s):
+        if self.is_single_width(s):
+            return len(s)
+        try:
+            return self.memo[s]
+        except KeyError:
+            pass
+        bmp_widths = self.table()
+        char_width = self.char_width
+        width = 0
+        for c in s:
+            ucs = ord(c)
+            w = bmp_widths[ucs] if ucs < 0x10000 else char_width(ucs)
+            if w < 0:
+                width = -1
+                break
+            width += w
+        if len(self.memo) >= WIDTH_MEMO_SIZE:
+            self.memo.clear()
+        self.memo[s] = width
+        return width
+
+_widths = WidthCalculator(mk_wcwidth, u'[\x20-\x7e\xa0-\xff]*\Z')
+_cjk_widths = WidthCalculator(mk_wcwidth_cjk, u'[\x20-\x7e]*\Z')
+
+wcwidth = _widths.width
+wcswidth = _widths.string_width
+wcwidth_cjk = _cjk_widths.width
+wcswidth_cjk = _cjk_widths.string_width
 
 if __name__ == "__main__":
     samples = (